@@ -4,17 +4,298 @@ import tkinter as tk
 from tkinter import messagebox
 from ttkbootstrap.scrolled import ScrolledFrame
 from datetime import datetime, timedelta
-import Main  # Assuming Main.py is in the same directory and provides 'calendar' instance
+import bisect
+import logging
+import sys
+import time
+import Main  # Assuming Main.py is in the same directory and provides get_calendar()
+
+class EventCard(ttk.Frame):
+    """Card showing one event; cards are pooled and rebound to other events while scrolling"""
+
+    def __init__(self, parent, app):
+        super().__init__(parent, borderwidth=1, relief="solid", padding=10) # Added border and padding
+        self.app = app
+        self.event = None
+
+        # Event title and time frame
+        header_frame = ttk.Frame(self)
+        header_frame.pack(fill="x", pady=(0, 5))
+        self.title_label = ttk.Label(header_frame, font=("TkDefaultFont", 12, "bold"))
+        self.title_label.pack(side="left", anchor="w")
+
+        # Every line exists even when empty, so all cards have the same height
+        self.time_label = ttk.Label(self)
+        self.time_label.pack(fill="x", anchor="w")
+        self.location_label = ttk.Label(self)
+        self.location_label.pack(fill="x", anchor="w")
+        self.description_label = ttk.Label(self)
+        self.description_label.pack(fill="x", anchor="w")
+        self.keywords_label = ttk.Label(self, foreground="grey") # Style keywords
+        self.keywords_label.pack(fill="x", anchor="w")
+
+        # Buttons for edit and delete
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(fill="x", pady=(10, 0)) # Add padding top
+
+        edit_btn = ttk.Button(btn_frame, text="Edit",
+                             command=lambda: self.app.edit_event(self.event),
+                             bootstyle="info-outline", width=8) # Smaller width
+        edit_btn.pack(side="right", padx=(5,0)) # Align right
+
+        delete_btn = ttk.Button(btn_frame, text="Delete",
+                               command=lambda: self.app.delete_event(self.event),
+                               bootstyle="danger-outline", width=8) # Smaller width
+        delete_btn.pack(side="right", padx=(0,5)) # Align right
+
+    def show(self, event):
+        """Display an event in this card"""
+        self.event = event
+        self.title_label.configure(text=event.title)
+
+        # Format time display more clearly
+        time_text = f"Start: {event.start_time}"
+        if event.end_time:
+            time_text += f"  End: {event.end_time}"
+
+        tags = []
+        if event.is_all_day():
+            tags.append("All day")
+        if event.is_multi_day():
+             tags.append("Multi-day")
+        if event.recurrence is not None:
+            tags.append(f"Repeats {event.recurrence.describe()}")
+
+        if tags:
+            time_text += f" ({', '.join(tags)})"
+        self.time_label.configure(text=time_text)
+
+        self.location_label.configure(text=f"Location: {event.location}" if event.location else "")
+
+        # Limit description length on card for brevity
+        desc_text = ""
+        if event.description:
+            desc_short = (event.description[:75] + '...') if len(event.description) > 75 else event.description
+            desc_text = f"Description: {desc_short.replace(chr(10), ' ')}" # Replace newlines
+        self.description_label.configure(text=desc_text)
+
+        self.keywords_label.configure(text="Keywords: " + ", ".join(event.keywords) if event.keywords else "")
+
+class VirtualEventList(ttk.Frame):
+    """Scrollable list of event cards that only creates widgets for the visible rows
+
+    Cards live in a canvas at fixed row offsets. Only the rows in the
+    viewport plus a small overscan are backed by EventCard widgets, which are
+    recycled as the user scrolls, so the widget count stays constant no
+    matter how many events are listed.
+    """
+
+    ROW_HEIGHT = 180
+    OVERSCAN = 2
+
+    def __init__(self, parent, app):
+        super().__init__(parent)
+        self.app = app
+        self.events = []
+        self.ordered = False  # Whether self.events is sorted by start time
+        self.series_ids = set()  # Ids of recurring events listed as occurrences
+        self.cards = []    # Pooled EventCard widgets
+        self.windows = []  # Canvas window item for each pooled card
+
+        self.message_label = ttk.Label(self, font="-weight bold")
+        self.message_label.pack(pady=(5,10), anchor='w')
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, yscrollincrement=self.ROW_HEIGHT // 4,
+                                background=ttk.Style().lookup("TFrame", "background"))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scroll)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", expand=True, fill="both")
+        self.canvas.bind("<Configure>", lambda event: self.update_scrollregion())
+
+        # Route the mouse wheel to this list while the pointer is over it
+        self.bind("<Enter>", lambda event: self.bind_wheel(True))
+        self.bind("<Leave>", lambda event: self.bind_wheel(False))
+
+    def bind_wheel(self, active):
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            if active:
+                self.bind_all(sequence, self.on_mousewheel)
+            else:
+                self.unbind_all(sequence)
+
+    def on_mousewheel(self, event):
+        # X11 reports Button-4/5, Windows and macOS report a signed delta
+        direction = -1 if event.num == 4 or getattr(event, "delta", 0) > 0 else 1
+        self.canvas.yview_scroll(direction, "units")
+        self.render()
+
+    def on_scroll(self, *args):
+        self.canvas.yview(*args)
+        self.render()
+
+    def set_events(self, events, message="", ordered=False):
+        """Show a new list of events, scrolled to the top
+
+        ordered says the list is sorted by start time, which lets
+        apply_change() find and insert rows by bisection.
+        """
+        self.events = events
+        self.ordered = ordered
+        # Lazy sequences (read-only archives) hold no occurrences and must not be walked
+        self.series_ids = ({event.id for event in events if isinstance(event, Main.Occurrence)}
+                           if isinstance(events, list) else set())
+        self.message_label.configure(text=message)
+        for card in self.cards:
+            card.event = None # Force every card to be refilled
+        self.canvas.yview_moveto(0)
+        self.update_scrollregion()
+
+    def set_message(self, message):
+        self.message_label.configure(text=message)
+
+    def find(self, event):
+        """Return the row index of the event with event.id, or None"""
+        if self.ordered:
+            # The calendar's own order, which puts unparsable start times last
+            key = Main.start_order(event)
+            i = bisect.bisect_left(self.events, key, key=Main.start_order)
+            while i < len(self.events) and Main.start_order(self.events[i]) == key:
+                if self.events[i].id == event.id:
+                    return i
+                i += 1
+        # Unordered list, or an edit moved the event away from its old start
+        for i, listed in enumerate(self.events):
+            if listed.id == event.id:
+                return i
+        return None
+
+    def apply_change(self, change, events, accepts=None):
+        """Patch the list after a Calendar change notification
+
+        accepts(event) says whether an added or updated event belongs in this
+        list; without it, only rows already listed are updated or removed.
+        Only the cards showing affected rows are refilled.
+        """
+        changed = set()
+        for event in events:
+            changed.add(event.id)
+            index = None if change == "added" else self.find(event)
+            keep = change != "removed" and (accepts(event) if accepts is not None else index is not None)
+            if index is not None:
+                if keep and not self.ordered:
+                    self.events[index] = event # Keep its place, e.g. the search rank
+                    continue
+                del self.events[index]
+            if keep:
+                if self.ordered:
+                    bisect.insort(self.events, event, key=Main.start_order)
+                else:
+                    self.events.append(event)
+
+        for card in self.cards:
+            if card.event is not None and card.event.id in changed:
+                card.event = None # Refill even if it is the same (mutated) object
+        self.update_scrollregion()
+
+    def update_scrollregion(self):
+        width = self.canvas.winfo_width()
+        self.canvas.configure(scrollregion=(0, 0, width, len(self.events) * self.ROW_HEIGHT))
+        self.render()
+
+    def render(self):
+        """Bind pooled cards to the rows in (and just around) the viewport"""
+        width = self.canvas.winfo_width()
+        top = self.canvas.canvasy(0)
+        first = max(0, int(top // self.ROW_HEIGHT) - self.OVERSCAN)
+        last = min(len(self.events), int((top + self.canvas.winfo_height()) // self.ROW_HEIGHT) + 1 + self.OVERSCAN)
+
+        while len(self.cards) < last - first:
+            card = EventCard(self.canvas, self.app)
+            self.cards.append(card)
+            self.windows.append(self.canvas.create_window(0, 0, window=card, anchor="nw"))
+
+        for slot, (card, window) in enumerate(zip(self.cards, self.windows)):
+            index = first + slot
+            if index < last:
+                event = self.events[index]
+                if card.event is not event:
+                    card.show(event)
+                self.canvas.coords(window, 0, index * self.ROW_HEIGHT)
+                self.canvas.itemconfigure(window, width=width, height=self.ROW_HEIGHT - 10)
+            else:
+                # Park unused cards above the scroll region, out of sight
+                self.canvas.coords(window, 0, -2 * self.ROW_HEIGHT)
 
 class CalendarApp(ttk.Window):
+    POLL_MS = 2000  # How often to look for changes written by other processes
+    REPEAT_CHOICES = ["Does not repeat", "Daily", "Weekly", "Monthly"]
+
     def __init__(self):
         super().__init__(themename="cosmo")
         self.title("Event Calendar")
         self.geometry("900x600")
-        # Use the singleton calendar instance from Main
-        self.calendar = Main.calendar
+        # Use the shared calendar instance from Main; it is loaded progressively
+        # once the window exists (unless something already loaded it). Saves
+        # run on a background thread so the UI never waits for the disk.
+        # Shared mode lets other processes (e.g. an importer) use the file too.
+        self.calendar = Main.get_calendar(autoload=False, background_save=True, shared=True)
+        if self.calendar.read_only:
+            self.title(f"Event Calendar - {self.calendar.filename} (read-only)")
+        # Add/edit/delete notifications patch the visible lists in place
+        self.calendar.subscribe(self.on_calendar_change)
+        # Set by "reloaded" notifications, which may come from the save
+        # thread; poll_calendar rebuilds the lists on the Tk thread
+        self.reload_pending = False
+        self.reloader = None  # Reload in progress, see poll_calendar
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.setup_ui()
+        self.after(self.POLL_MS, self.poll_calendar)
+
+    def poll_calendar(self):
+        """Pick up changes other processes wrote to the calendar file"""
+        if self.calendar.loaded and self.reloader is None:
+            # A new snapshot is re-read in time slices, like the initial load
+            self.reloader = self.calendar.reload_progressively()
+            self.reload_step()
+        self.apply_pending_reload()
+        self.after(self.POLL_MS, self.poll_calendar)
+
+    def reload_step(self, time_slice_ms=50):
+        """Run the reload started by poll_calendar for one time slice, then yield to the Tk loop"""
+        deadline = time.perf_counter() + time_slice_ms / 1000
+        while time.perf_counter() < deadline:
+            try:
+                next(self.reloader)
+            except StopIteration:
+                self.reloader = None
+                self.apply_pending_reload()
+                return
+            except Exception as e:
+                # Keep polling; the next poll tries again
+                logging.exception("Unexpected error reloading events")
+                self.reloader = None
+                self.set_status(f"Could not reload events: {e}")
+                return
+        self.set_status("Reloading events changed by another program...")
+        self.after(1, self.reload_step)
+
+    def apply_pending_reload(self):
+        """Rebuild the lists after a "reloaded" notification, once no reload is in progress"""
+        if self.reload_pending and self.reloader is None:
+            self.reload_pending = False
+            self.refresh_after_reload()
+
+    def on_close(self):
+        """Write any pending changes before the window goes away"""
+        self.set_status("Saving...")
+        if self.reloader is not None:
+            # Pending changes must be saved on top of the complete calendar
+            for _ in self.reloader:
+                pass
+        self.calendar.close()
+        self.destroy()
 
     def setup_ui(self):
         """Set up the main UI components"""
@@ -65,12 +346,48 @@ class CalendarApp(ttk.Window):
                        value="all", command=self.refresh_events, bootstyle="toolbutton")
         rb_all.pack(side="left", padx=5)
 
-        # Events list using ScrolledFrame
-        self.events_container = ScrolledFrame(self.events_frame, autohide=True)
-        self.events_container.pack(expand=True, fill="both", padx=10, pady=10)
+        # Events list; only the visible cards are materialized
+        self.events_list = VirtualEventList(self.events_frame, self)
+        self.events_list.pack(expand=True, fill="both", padx=10, pady=10)
 
-        # Initial load of events
-        self.refresh_events()
+        # Initial load of events; a calendar that has not been read from disk
+        # yet is loaded in batches so the window stays responsive
+        if self.calendar.loaded:
+            self.refresh_events()
+        else:
+            self.load_events_progressively()
+
+    def load_events_progressively(self, first_screen=20, time_slice_ms=50):
+        """Load the calendar in the background of the Tk loop, showing upcoming events as they are parsed"""
+        self.set_status("Loading events...")
+        shown = []
+        self.events_list.set_events(shown, "Loading events...")
+        loader = self.calendar.load_events_progressively()
+        now = Main.to_minutes(datetime.now())
+        state = {"loaded": 0}
+
+        def step():
+            deadline = time.perf_counter() + time_slice_ms / 1000
+            while time.perf_counter() < deadline:
+                try:
+                    batch = next(loader)
+                except StopIteration:
+                    # Everything is loaded and indexed: show the real view
+                    self.refresh_events()
+                    return
+                state["loaded"] += len(batch)
+                # Fill the first screen with upcoming/ongoing events from this batch
+                for event in batch:
+                    if len(shown) >= first_screen:
+                        break
+                    end = event.end_minutes if event.end_minutes is not None else event.start_minutes
+                    if end is not None and end >= now:
+                        shown.append(event)
+            self.events_list.update_scrollregion()
+            self.set_status(f"Loading events... {state['loaded']} read so far.")
+            self.after(1, step)
+
+        self.after(1, step)
 
     def setup_add_event_tab(self):
         """Set up the add/edit event form tab"""
@@ -129,9 +446,24 @@ class CalendarApp(ttk.Window):
         self.keywords_entry = ttk.Entry(form_frame, textvariable=self.keywords_var, width=40)
         self.keywords_entry.grid(row=6, column=1, sticky="ew", pady=5, padx=5)
 
+        # Recurrence
+        ttk.Label(form_frame, text="Repeat:").grid(row=7, column=0, sticky="w", pady=5, padx=5)
+        self.repeat_var = ttk.StringVar(value=self.REPEAT_CHOICES[0])
+        repeat_combo = ttk.Combobox(form_frame, textvariable=self.repeat_var, values=self.REPEAT_CHOICES,
+                                    state="readonly", width=20)
+        repeat_combo.grid(row=7, column=1, sticky="w", pady=5, padx=5)
+
+        ttk.Label(form_frame, text="Repeat until (YYYY-MM-DD HH:MM):").grid(row=8, column=0, sticky="w", pady=5, padx=5)
+        self.repeat_until_var = ttk.StringVar()
+        ttk.Entry(form_frame, textvariable=self.repeat_until_var, width=40).grid(row=8, column=1, sticky="ew", pady=5, padx=5)
+
+        ttk.Label(form_frame, text="Occurrences (empty for no limit):").grid(row=9, column=0, sticky="w", pady=5, padx=5)
+        self.repeat_count_var = ttk.StringVar()
+        ttk.Entry(form_frame, textvariable=self.repeat_count_var, width=40).grid(row=9, column=1, sticky="ew", pady=5, padx=5)
+
         # Buttons Frame
         button_frame = ttk.Frame(form_frame)
-        button_frame.grid(row=7, column=0, columnspan=3, pady=15) # Span all columns
+        button_frame.grid(row=10, column=0, columnspan=3, pady=15) # Span all columns
 
         # Add/Update button
         self.submit_button = ttk.Button(button_frame, text="Add Event", command=self.add_or_update_event,
@@ -146,6 +478,7 @@ class CalendarApp(ttk.Window):
 
         # Hidden event ID for editing
         self.editing_event_id = None
+        self.editing_recurrence = None # Rule of the event being edited, to keep what the form does not show
 
         # Form configuration
         form_frame.columnconfigure(1, weight=1) # Allow entry column to expand
@@ -155,7 +488,7 @@ class CalendarApp(ttk.Window):
         search_controls = ttk.Frame(self.search_frame)
         search_controls.pack(fill="x", padx=10, pady=10)
 
-        ttk.Label(search_controls, text="Search by Keyword:").pack(side="left", padx=5)
+        ttk.Label(search_controls, text="Search (text or keyword):").pack(side="left", padx=5)
 
         self.search_var = ttk.StringVar()
         search_entry = ttk.Entry(search_controls, textvariable=self.search_var, width=30)
@@ -172,147 +505,101 @@ class CalendarApp(ttk.Window):
                                   bootstyle="secondary-outline")
         clear_button.pack(side="left", padx=5)
 
-        self.search_results = ScrolledFrame(self.search_frame, autohide=True)
+        self.search_results = VirtualEventList(self.search_frame, self)
         self.search_results.pack(expand=True, fill="both", padx=10, pady=10)
 
     def clear_search(self):
         """Clear search input and results"""
         self.search_var.set("")
         # Clear current results
-        for widget in self.search_results.winfo_children():
-            widget.destroy()
-        ttk.Label(self.search_results, text="Enter a keyword to search.").pack(pady=20)
+        self.search_results.set_events([], "Enter text or a keyword to search.")
         self.set_status("Search cleared")
 
 
     def refresh_events(self):
         """Refresh the events list based on the selected view"""
         self.set_status("Refreshing events...")
-        # Clear current events
-        # Use self.events_container.interior for ScrolledFrame content
-        for widget in self.events_container.winfo_children():
-            widget.destroy()
 
         # Get events based on selected view
         view = self.view_var.get()
         if view == "upcoming":
             events = self.calendar.get_upcoming_events()
-            if not events:
-                 ttk.Label(self.events_container, text="No upcoming or ongoing events.").pack(pady=20)
-            else:
-                 ttk.Label(self.events_container, text="Upcoming & Ongoing Events:", font="-weight bold").pack(pady=(5,10), anchor='w')
+        elif self.calendar.read_only:
+            # Never patched; keep an archive's lazy sequence undecoded
+            events = self.calendar.get_all_events()
         else:
-            events = self.calendar.events # Assumes events are sorted by date in Calendar
-            if not events:
-                 ttk.Label(self.events_container, text="No events found.").pack(pady=20)
-            else:
-                 ttk.Label(self.events_container, text="All Events:", font="-weight bold").pack(pady=(5,10), anchor='w')
+            # Copy: the list is patched by on_calendar_change, not by the calendar
+            events = list(self.calendar.get_all_events()) # Sorted by start time
 
+        # The list only builds cards for the rows currently in view
+        self.events_list.set_events(events, self.events_message(), ordered=True)
 
         if not events:
             self.set_status("No events to display.")
             return
 
-        # Add each event to the container
-        count = 0
-        for event in events:
-            self.create_event_card(self.events_container, event)
-            count += 1
+        self.set_status(f"Displayed {len(events)} event(s).")
+
+    def events_message(self):
+        """Heading for the events tab in its current view"""
+        if self.view_var.get() == "upcoming":
+            return "Upcoming & Ongoing Events:" if self.events_list.events else "No upcoming or ongoing events."
+        return "All Events:" if self.events_list.events else "No events found."
+
+    def in_current_view(self, event):
+        """Whether an event belongs in the events tab's current view"""
+        if self.view_var.get() != "upcoming":
+            return True
+        end = event.end_minutes if event.end_minutes is not None else event.start_minutes
+        return end is not None and end >= Main.to_minutes(datetime.now())
+
+    def on_calendar_change(self, change, events):
+        """Patch the affected rows of both lists after an add, edit or delete"""
+        if not self.calendar.loaded:
+            return # The list is rebuilt once loading finishes
+        if change == "reloaded":
+            # Another process changed the file. This may arrive from the save
+            # thread, which must never call Tk: leave it to poll_calendar
+            self.reload_pending = True
+            return
+        if any(event.recurrence is not None or event.id in self.events_list.series_ids for event in events):
+            # Occurrences are generated per query: rebuild rather than patch
+            self.after_idle(self.refresh_after_reload)
+            return
+        self.events_list.apply_change(change, events, accepts=self.in_current_view)
+        self.events_list.set_message(self.events_message())
+        # Search results are a snapshot: update or drop listed rows, never add
+        self.search_results.apply_change(change, events)
 
-        self.set_status(f"Displayed {count} event(s).")
+    def refresh_after_reload(self):
+        """Rebuild both lists from the calendar"""
+        self.refresh_events()
+        if self.search_var.get().strip():
+            self.search_events()
 
     def search_events(self, event=None): # Added event=None for binding
-        """Search events by keyword"""
+        """Search events by full text (title, location, description) and keyword"""
         keyword = self.search_var.get().strip()
         if not keyword:
             messagebox.showwarning("Search", "Please enter a keyword to search.")
             return
 
         self.set_status(f"Searching for '{keyword}'...")
-        # Clear current results
-        for widget in self.search_results.winfo_children():
-            widget.destroy()
 
-        # Get events by keyword
-        events = self.calendar.get_events_by_keyword(keyword)
+        # Ranked full-text matches first, then keyword matches not already found
+        events = self.calendar.search(keyword)
+        found_ids = {event.id for event in events}
+        events += [event for event in self.calendar.get_events_by_keyword(keyword)
+                   if event.id not in found_ids]
 
         if not events:
-            ttk.Label(self.search_results, text=f"No events found for keyword '{keyword}'").pack(pady=20)
+            self.search_results.set_events([], f"No events found for '{keyword}'")
             self.set_status(f"No results found for '{keyword}'.")
             return
 
         # Display found events
-        count = 0
-        for event in events:
-            # Pass search_results as parent
-            self.create_event_card(self.search_results, event)
-            count += 1
-        self.set_status(f"Found {count} event(s) for '{keyword}'.")
-
-
-    def create_event_card(self, parent, event):
-        """Create a card for an event in the specified parent container's interior"""
-        # Important: Add card to parent directly (ScrolledFrame handles interior placement)
-        card = ttk.Frame(parent, borderwidth=1, relief="solid", padding=10) # Added border and padding
-        card.pack(fill="x", padx=5, pady=5) # Use pack inside ScrolledFrame
-
-        # Event title and time frame
-        header_frame = ttk.Frame(card)
-        header_frame.pack(fill="x", pady=(0, 5))
-
-        title_label = ttk.Label(header_frame, text=event.title, font=("TkDefaultFont", 12, "bold"))
-        title_label.pack(side="left", anchor="w")
-
-        # Format time display more clearly
-        start_dt_str = event.start_time
-        end_dt_str = event.end_time if event.end_time else ""
-        time_text = f"Start: {start_dt_str}"
-        if end_dt_str:
-            time_text += f"  End: {end_dt_str}"
-
-        tags = []
-        if event.is_all_day():
-            tags.append("All day")
-        if event.is_multi_day():
-             tags.append("Multi-day")
-
-        if tags:
-            time_text += f" ({', '.join(tags)})"
-
-
-        time_label = ttk.Label(card, text=time_text)
-        time_label.pack(fill="x", anchor="w")
-
-        # Location and description if they exist
-        if event.location:
-            location_label = ttk.Label(card, text=f"Location: {event.location}")
-            location_label.pack(fill="x", anchor="w")
-
-        if event.description:
-            # Limit description length on card for brevity
-            desc_short = (event.description[:75] + '...') if len(event.description) > 75 else event.description
-            desc_label = ttk.Label(card, text=f"Description: {desc_short.replace(chr(10), ' ')}") # Replace newlines
-            desc_label.pack(fill="x", anchor="w")
-
-        # Keywords if they exist
-        if event.keywords:
-            keywords_text = "Keywords: " + ", ".join(event.keywords)
-            keywords_label = ttk.Label(card, text=keywords_text, foreground="grey") # Style keywords
-            keywords_label.pack(fill="x", anchor="w")
-
-        # Buttons for edit and delete
-        btn_frame = ttk.Frame(card)
-        btn_frame.pack(fill="x", pady=(10, 0)) # Add padding top
-
-        edit_btn = ttk.Button(btn_frame, text="Edit",
-                             command=lambda e=event: self.edit_event(e),
-                             bootstyle="info-outline", width=8) # Smaller width
-        edit_btn.pack(side="right", padx=(5,0)) # Align right
-
-        delete_btn = ttk.Button(btn_frame, text="Delete",
-                               command=lambda e=event: self.delete_event(e),
-                               bootstyle="danger-outline", width=8) # Smaller width
-        delete_btn.pack(side="right", padx=(0,5)) # Align right
+        self.search_results.set_events(events, f"Results for '{keyword}':")
+        self.set_status(f"Found {len(events)} event(s) for '{keyword}'.")
 
     def toggle_all_day(self):
         """Handle the all-day checkbox toggle, enabling/disabling end time"""
@@ -349,6 +636,9 @@ class CalendarApp(ttk.Window):
 
     def add_or_update_event(self):
         """Add a new event or update existing one based on editing_event_id"""
+        if not self.calendar.loaded:
+            messagebox.showwarning("Please wait", "Events are still loading.")
+            return
         # Validate required fields
         title = self.title_var.get().strip()
         start_time = self.start_var.get().strip()
@@ -368,6 +658,7 @@ class CalendarApp(ttk.Window):
             # Use the correct end_time based on all_day checkbox
             # If all_day is checked, toggle_all_day should have set end_var to "YYYY-MM-DD 23:59"
             final_end_time = end_time if end_time else None
+            recurrence = self.form_recurrence()
 
 
             if self.editing_event_id is not None:
@@ -379,7 +670,9 @@ class CalendarApp(ttk.Window):
                     final_end_time, # Pass potentially None end_time
                     self.location_var.get().strip(),
                     description,
-                    keywords
+                    keywords,
+                    recurrence,
+                    expected_version=self.editing_event_version
                 )
                 if updated_event:
                      messagebox.showinfo("Success", "Event updated successfully.")
@@ -398,19 +691,22 @@ class CalendarApp(ttk.Window):
                     final_end_time, # Pass potentially None end_time
                     self.location_var.get().strip(),
                     description,
-                    keywords
+                    keywords,
+                    recurrence
                 )
                 messagebox.showinfo("Success", "Event added successfully.")
                 self.set_status("Event added.")
 
-            # Clear the form and reset state
+            # Clear the form and reset state; the lists were already patched
+            # by on_calendar_change
             self.clear_form()
 
-            # Refresh events list in the "Events" tab
-            self.refresh_events()
             # Switch back to events tab
             self.notebook.select(0)
 
+        except Main.EditConflictError as e:
+            messagebox.showerror("Conflict", f"{e}\nReopen the event to see the current version.")
+            self.set_status(f"Error: {e}")
         except ValueError as e:
             messagebox.showerror("Input Error", str(e))
             self.set_status(f"Error: {e}")
@@ -421,10 +717,30 @@ class CalendarApp(ttk.Window):
              logging.exception("Unexpected error during add/update event")
 
 
+    def form_recurrence(self):
+        """Build the recurrence rule from the Repeat fields, or None if the event does not repeat"""
+        freq = self.repeat_var.get().lower()
+        if freq not in Main.Recurrence.FREQUENCIES:
+            return None
+        count = self.repeat_count_var.get().strip()
+        if count and not count.isdigit():
+            raise ValueError("Occurrences must be a whole number")
+        rule = {"freq": freq, "count": int(count) if count else None,
+                "until": self.repeat_until_var.get().strip() or None}
+        # Keep what the form cannot show (interval, weekdays, skipped
+        # occurrences) when the frequency is unchanged
+        previous = self.editing_recurrence
+        if previous is not None and previous.freq == freq:
+            rule.update(interval=previous.interval, weekdays=previous.weekdays, exceptions=previous.exceptions)
+        return rule
+
     def edit_event(self, event):
         """Load event data into the form for editing"""
+        # An occurrence edits its whole series
+        event = getattr(event, "series", event)
         self.clear_form() # Clear form before loading new data
         self.editing_event_id = event.id
+        self.editing_event_version = event.version # Saving fails if someone else changes it meanwhile
         self.set_status(f"Editing event: {event.title}")
 
         # Populate the form fields
@@ -440,6 +756,13 @@ class CalendarApp(ttk.Window):
 
         self.keywords_var.set(", ".join(event.keywords) if event.keywords else "")
 
+        recurrence = event.recurrence
+        self.editing_recurrence = recurrence
+        if recurrence is not None:
+            self.repeat_var.set(recurrence.freq.title())
+            self.repeat_until_var.set(recurrence.until or "")
+            self.repeat_count_var.set(str(recurrence.count) if recurrence.count is not None else "")
+
         # Check if it's an all-day event and set checkbox/end time state
         is_all_day = event.is_all_day()
         self.all_day_var.set(is_all_day)
@@ -467,24 +790,49 @@ class CalendarApp(ttk.Window):
 
     def delete_event(self, event):
         """Delete an event after confirmation"""
-        if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the event '{event.title}'?", icon='warning'):
-            if self.calendar.delete_event(event.id):
-                 self.set_status(f"Event '{event.title}' deleted.")
-                 messagebox.showinfo("Success", "Event deleted successfully.")
-                 # Refresh events list in the current view (Events tab or Search tab)
-                 current_tab_index = self.notebook.index(self.notebook.select())
-                 if current_tab_index == 0: # Events tab
-                     self.refresh_events()
-                 elif current_tab_index == 2: # Search tab
-                     # Re-run search to update results, or simply refresh the main list?
-                     # Re-running search seems more appropriate
-                     self.search_events()
-                 # If the deleted event was being edited, clear the form
-                 if self.editing_event_id == event.id:
-                     self.clear_form()
-            else:
-                 messagebox.showerror("Error", f"Could not delete event '{event.title}'. It might have already been removed.")
-                 self.set_status("Error deleting event.")
+        if not self.calendar.loaded:
+            messagebox.showwarning("Please wait", "Events are still loading.")
+            return
+        if isinstance(event, Main.Occurrence):
+            # Yes: skip this occurrence, No: delete the series, Cancel: nothing
+            only_this = messagebox.askyesnocancel(
+                "Delete Recurring Event",
+                f"'{event.title}' repeats {event.recurrence.describe()}.\n\n"
+                f"Delete only the occurrence on {event.start_time}?\n"
+                "Choose No to delete every occurrence.", icon='warning')
+            if only_this is None:
+                return
+            if only_this:
+                try:
+                    skipped = self.calendar.skip_occurrence(event.id, event.start_time, expected_version=event.version)
+                except Main.EditConflictError as e:
+                    messagebox.showerror("Conflict", f"{e}\nIt was not deleted.")
+                    self.set_status(f"Error: {e}")
+                    return
+                if skipped:
+                    self.set_status(f"Occurrence of '{event.title}' on {event.start_time} deleted.")
+                else:
+                    messagebox.showerror("Error", f"Could not delete the occurrence of '{event.title}'.")
+                    self.set_status("Error deleting occurrence.")
+                return
+        elif not messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the event '{event.title}'?", icon='warning'):
+            return
+        try:
+            deleted = self.calendar.delete_event(event.id, expected_version=event.version)
+        except Main.EditConflictError as e:
+            messagebox.showerror("Conflict", f"{e}\nIt was not deleted.")
+            self.set_status(f"Error: {e}")
+            return
+        if deleted:
+             self.set_status(f"Event '{event.title}' deleted.")
+             messagebox.showinfo("Success", "Event deleted successfully.")
+             # The card was already removed from both lists by on_calendar_change
+             # If the deleted event was being edited, clear the form
+             if self.editing_event_id == event.id:
+                 self.clear_form()
+        else:
+             messagebox.showerror("Error", f"Could not delete event '{event.title}'. It might have already been removed.")
+             self.set_status("Error deleting event.")
 
 
     def clear_form(self):
@@ -498,6 +846,10 @@ class CalendarApp(ttk.Window):
         self.keywords_var.set("")
         self.all_day_var.set(False)
         self.end_entry.config(state='normal') # Ensure end time is enabled
+        self.repeat_var.set(self.REPEAT_CHOICES[0])
+        self.repeat_until_var.set("")
+        self.repeat_count_var.set("")
+        self.editing_recurrence = None
 
         # Reset editing state
         self.editing_event_id = None
@@ -506,12 +858,17 @@ class CalendarApp(ttk.Window):
         self.set_status("Form cleared. Ready to add new event.")
 
 if __name__ == "__main__":
-    # Ensure Main.py has run and initialized 'calendar'
-    if hasattr(Main, 'calendar'):
+    # Main only logs through its logger; the application decides where records go
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) > 1:
+        # python GUI.py <snapshot>: browse a binary snapshot read-only, decoding only what is shown
+        Main.default_calendar = Main.MappedCalendar(sys.argv[1])
+    # Ensure Main.py provides the shared calendar
+    if hasattr(Main, 'get_calendar'):
         app = CalendarApp()
         app.mainloop()
     else:
-        print("Error: Could not find 'calendar' instance in Main.py")
+        print("Error: Could not find 'get_calendar' in Main.py")
         # Optionally show an error dialog
         root = tk.Tk()
         root.withdraw() # Hide the main Tk window
@@ -1,69 +1,263 @@
-from datetime import datetime, timedelta
+from array import array
+import atexit
+from datetime import date, datetime, timedelta
+import bisect
+from contextlib import contextmanager
+import heapq
+import inspect
+import itertools
 import json
+import math
+import mmap
 import os
+import re
+import reprlib
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
 from functools import wraps
+import gzip
 import logging
+import zlib
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Messages use %-style arguments, so they are only formatted if a handler
+# wants them. Configuring handlers is left to the application (see GUI.py).
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+# "HH:MM" -> minutes since midnight, and "YYYY-MM-DD" -> days since 1970-01-01
+# for dates already seen; together they turn most parses into two dict lookups
+TIME_OF_DAY_MINUTES = {f"{h:02d}:{m:02d}": h * 60 + m for h in range(24) for m in range(60)}
+DATE_RE = re.compile(r"(\d{4})-(\d\d)-(\d\d)", re.ASCII)
+DAY_CACHE_LIMIT = 100000
+day_cache = {}
+
+def parse_day(text):
+    """Return days since 1970-01-01 for a 'YYYY-MM-DD' string, or None if invalid"""
+    day = day_cache.get(text)
+    if day is None:
+        match = DATE_RE.fullmatch(text)
+        if not match:
+            return None
+        try:
+            # date() validates the month and day
+            day = date(*map(int, match.groups())).toordinal() - EPOCH_ORDINAL
+        except ValueError:
+            return None
+        if len(day_cache) >= DAY_CACHE_LIMIT:
+            day_cache.clear()
+        day_cache[text] = day
+    return day
+
+def parse_minutes(value):
+    """Parse a 'YYYY-MM-DD HH:MM' string into minutes since 1970-01-01
+
+    The fixed-width format is parsed by hand, which is much cheaper than
+    strptime; other spellings strptime accepts (e.g. '2026-1-5 9:05') fall
+    back to it. Raises ValueError for invalid dates.
+    """
+    if len(value) == 16 and value[10] == ' ':
+        minutes = TIME_OF_DAY_MINUTES.get(value[11:])
+        if minutes is not None:
+            day = parse_day(value[:10])
+            if day is not None:
+                return day * 1440 + minutes
+    return to_minutes(datetime.strptime(value, DATE_FORMAT))
+
+def to_minutes(value):
+    """Convert a 'YYYY-MM-DD HH:MM' string or datetime to minutes since 1970-01-01"""
+    if isinstance(value, str):
+        return parse_minutes(value)
+    return int((value - EPOCH).total_seconds()) // 60
+
+TIME_OF_DAY_STRINGS = [f"{h:02d}:{m:02d}" for h in range(24) for m in range(60)]
+day_strings = {}
+
+def format_minutes(minutes):
+    """Format minutes since 1970-01-01 as a 'YYYY-MM-DD HH:MM' string"""
+    day, minute_of_day = divmod(minutes, 1440)
+    day_text = day_strings.get(day)
+    if day_text is None:
+        if len(day_strings) >= DAY_CACHE_LIMIT:
+            day_strings.clear()
+        day_text = day_strings[day] = date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+    return day_text + " " + TIME_OF_DAY_STRINGS[minute_of_day]
+
+def intern_string(value):
+    """Intern a string so repeated locations/keywords share one object"""
+    return sys.intern(value) if type(value) is str else value
+
+def optional_minutes(value):
+    """Like parse_minutes, but return None for empty or unparsable values"""
+    if not value:
+        return None
+    try:
+        return parse_minutes(value)
+    except (ValueError, TypeError):
+        return None
+
+def start_order(event):
+    """Sort key putting events in start time order, those whose start time does not parse last"""
+    start = event.start_minutes
+    return (False, start) if start is not None else (True, 0)
+
+# Argument formatting for log_action: long descriptions and keyword lists are cut short
+action_repr = reprlib.Repr()
+action_repr.maxstring = 60
+action_repr.maxother = 60
+action_repr.maxlist = action_repr.maxtuple = action_repr.maxdict = 5
+
+class LazyArgs:
+    """Formats a call's arguments with action_repr, only when the log record is emitted"""
+
+    __slots__ = ("args", "kwargs")
+
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        parts = [action_repr.repr(arg) for arg in self.args]
+        parts += [f"{key}={action_repr.repr(value)}" for key, value in self.kwargs.items()]
+        return ", ".join(parts)
+
+ACTION_LOG_SAMPLE_EVERY = 1  # Log every Nth call of each action; raise it for bulk workloads
+
+def log_action(func=None, *, sample_every=None, level=logging.DEBUG):
+    """Decorator for logging actions performed on events
+
+    Logs the call (arguments truncated) and its completion at `level`, for
+    one call in every `sample_every` (default: the module-wide
+    ACTION_LOG_SAMPLE_EVERY). Nothing is formatted unless the logger is
+    enabled for `level`. Failures are always logged. Records carry the
+    action name and call number in their `action` and `call` attributes.
+    Use as @log_action or @log_action(sample_every=100).
+    """
+    if func is None:
+        return lambda func: log_action(func, sample_every=sample_every, level=level)
+    name = func.__name__
+    calls = itertools.count(1)
 
-def log_action(func):
-    """Decorator for logging actions performed on events"""
     @wraps(func)
     def wrapper(*args, **kwargs):
+        call = next(calls)
+        if not logger.isEnabledFor(level) or call % (sample_every or ACTION_LOG_SAMPLE_EVERY):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                logger.error("Error during %s: %s", name, e, extra={"action": name, "call": call})
+                raise # Re-raise the exception after logging
+        extra = {"action": name, "call": call}
         # Log only relevant args/kwargs, excluding 'self'
-        func_args = args[1:]
-        logging.info(f"Calling {func.__name__} with args: {func_args}, kwargs: {kwargs}")
+        logger.log(level, "Calling %s(%s)", name, LazyArgs(args[1:], kwargs), extra=extra)
+        started = time.perf_counter()
         try:
             result = func(*args, **kwargs)
-            logging.info(f"Function {func.__name__} completed successfully")
-            return result
         except Exception as e:
-            logging.error(f"Error during {func.__name__}: {e}")
+            logger.error("Error during %s: %s", name, e, extra=extra)
             raise # Re-raise the exception after logging
+        logger.log(level, "Function %s completed in %.3f ms", name, (time.perf_counter() - started) * 1000,
+                   extra=extra)
+        return result
+    return wrapper
+
+def measured(func):
+    """Decorator recording a Calendar method's latency in self.metrics, if the calendar is instrumented
+
+    Uninstrumented calendars pay a single attribute check.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None:
+            return func(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = func(self, *args, **kwargs)
+        except BaseException:
+            metrics.observe(name, time.perf_counter() - started, error=True)
+            raise
+        metrics.observe(name, time.perf_counter() - started)
+        return result
+    return wrapper
+
+def synchronized(func):
+    """Decorator running a Calendar method while holding the calendar's state lock
+
+    In shared mode it also holds the inter-process file lock and first picks
+    up whatever other processes wrote.
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.read_only:
+            raise ReadOnlyCalendarError(f"'{self.filename}' is open read-only")
+        with self.file_lock(), self._state_lock:
+            if self.shared and self.loaded:
+                self.reload_if_changed()
+            return func(self, *args, **kwargs)
+    return wrapper
+
+def synchronized_read(func):
+    """Decorator running a Calendar query under the read side of the state lock in thread-safe mode"""
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not self.thread_safe:
+            return func(self, *args, **kwargs)
+        with self._state_lock.read():
+            return func(self, *args, **kwargs)
     return wrapper
 
 def validate_date_format(func):
-    """Decorator for validating date formats in specific arguments"""
+    """Decorator for validating date formats in the start_time/end_time arguments"""
+    # Resolve argument positions once, so methods with extra leading
+    # parameters (edit_event takes event_id first) are validated correctly
+    params = list(inspect.signature(func).parameters)
+    start_index = params.index('start_time')
+    end_index = params.index('end_time')
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        # Expected positions: self=args[0], title=args[1], start_time=args[2], end_time=args[3]
-        start_time_str = None
-        end_time_str = None
-
-        # Get start_time from args or kwargs
-        if len(args) > 2:
-            start_time_str = args[2]
-        elif 'start_time' in kwargs:
-            start_time_str = kwargs['start_time']
-
-        # Get end_time from args or kwargs
-        if len(args) > 3:
-            end_time_str = args[3]
-        elif 'end_time' in kwargs:
-            end_time_str = kwargs['end_time']
+        start_time_str = args[start_index] if len(args) > start_index else kwargs.get('start_time')
+        end_time_str = args[end_index] if len(args) > end_index else kwargs.get('end_time')
 
         try:
             # Validate start_time if it's a non-empty string
             if start_time_str and isinstance(start_time_str, str):
-                datetime.strptime(start_time_str, "%Y-%m-%d %H:%M")
+                parse_minutes(start_time_str)
 
-            # Validate end_time if it's a non-empty string
+            # Allow end_time to be None or empty string, only validate if provided
             if end_time_str and isinstance(end_time_str, str):
-                 # Allow end_time to be None or empty string, only validate if provided
-                if end_time_str:
-                    datetime.strptime(end_time_str, "%Y-%m-%d %H:%M")
+                parse_minutes(end_time_str)
 
         except ValueError:
             error_msg = "Invalid date format. Use YYYY-MM-DD HH:MM"
-            logging.error(error_msg)
+            logger.error(error_msg)
             raise ValueError(error_msg)
 
         return func(*args, **kwargs)
     return wrapper
 
 class Event:
-    def __init__(self, title, start_time, end_time=None, location="", description="", keywords=None):
+    # No per-instance __dict__: events are by far the most numerous objects
+    __slots__ = ("title", "_start_time", "start_minutes", "_end_time", "end_minutes",
+                 "location", "description", "keywords", "id", "version", "recurrence")
+
+    def __init__(self, title, start_time, end_time=None, location="", description="", keywords=None,
+                 recurrence=None):
         if not title:
              raise ValueError("Event title cannot be empty")
         if not start_time:
@@ -72,67 +266,115 @@ class Event:
         self.title = title
         self.start_time = start_time  # Store as string as received
         self.end_time = end_time      # Store as string or None
-        self.location = location
+        # Locations and keywords repeat a lot across events; share one copy of each
+        self.location = intern_string(location)
         self.description = description
-        self.keywords = keywords if keywords else []
+        self.keywords = [intern_string(kw) for kw in keywords] if keywords else []
         self.id = None  # Will be set when added to the calendar
+        self.version = 1  # Bumped by every edit, for optimistic concurrency checks
+        self.recurrence = Recurrence.coerce(recurrence)  # None for a one-off event
+
+    # The string times are kept for display and serialization; assigning one
+    # also caches it as minutes since 1970-01-01 (None if it does not parse),
+    # which is what all date logic works with.
+    @property
+    def start_time(self):
+        return self._start_time
+
+    @start_time.setter
+    def start_time(self, value):
+        self._start_time = value
+        self.start_minutes = optional_minutes(value)
+
+    @property
+    def end_time(self):
+        return self._end_time
+
+    @end_time.setter
+    def end_time(self, value):
+        self._end_time = value
+        self.end_minutes = optional_minutes(value)
 
     def is_all_day(self):
-        """Check if the event is an all-day event based on string times"""
-        # Check fails if start_time is not a string or has wrong format
-        try:
-            start = datetime.strptime(self.start_time, "%Y-%m-%d %H:%M")
-            # Condition 1: Start at 00:00 and no end time (implicit single all-day)
-            # Condition 2: Start at 00:00 and end at 23:59 on the same day
-            if start.hour == 0 and start.minute == 0:
-                 if not self.end_time:
-                     # Could be considered all-day for the start date
-                     # Let's stick to the explicit 00:00-23:59 convention for now
-                     # return True
-                     return False # Keep consistent with GUI toggle logic
-                 else:
-                     try:
-                         end = datetime.strptime(self.end_time, "%Y-%m-%d %H:%M")
-                         return start.date() == end.date() and end.hour == 23 and end.minute == 59
-                     except (ValueError, TypeError):
-                         return False # Invalid end time format
-            return False
-        except (ValueError, TypeError):
-             # If start_time is not a valid string, it's not all-day by this definition
+        """Check if the event is an all-day event (00:00 to 23:59 on the same day)"""
+        # An event without an end time is not all-day, consistent with the GUI toggle logic
+        if self.start_minutes is None or self.end_minutes is None:
             return False
+        return self.start_minutes % 1440 == 0 and self.end_minutes - self.start_minutes == 1439
 
     def is_multi_day(self):
-        """Check if the event spans multiple days based on string times"""
-        if not self.end_time:
+        """Check if the event spans multiple days"""
+        if self.start_minutes is None or self.end_minutes is None:
             return False
+        # Check if the date part is different
+        return self.start_minutes // 1440 != self.end_minutes // 1440
 
-        try:
-            start = datetime.strptime(self.start_time, "%Y-%m-%d %H:%M")
-            end = datetime.strptime(self.end_time, "%Y-%m-%d %H:%M")
-            # Check if the date part is different
-            return start.date() != end.date()
-        except (ValueError, TypeError):
-             # Invalid date format strings
-            return False
+    def duration_minutes(self):
+        """Length of the event (of each occurrence, if recurring) in minutes"""
+        if self.start_minutes is None or self.end_minutes is None:
+            return 0
+        return max(0, self.end_minutes - self.start_minutes)
+
+    def span_end_minutes(self):
+        """Last minute the event (or its whole series) covers; Recurrence.OPEN_END if it never ends"""
+        start = self.start_minutes
+        if self.recurrence is not None:
+            end = self.recurrence.span_end(start, self.duration_minutes())
+            return Recurrence.OPEN_END if end is None else end
+        # Treat a missing or unparsable end time as a point-in-time event
+        return start if self.end_minutes is None else max(start, self.end_minutes)
+
+    def occurrences(self, start, end):
+        """Yield the occurrences of a recurring event overlapping [start, end] (minutes), in order"""
+        duration = self.duration_minutes()
+        has_end = self.end_minutes is not None
+        for occurrence in self.recurrence.occurrences(self.start_minutes, duration, start, end):
+            yield Occurrence(self, occurrence, occurrence + duration if has_end else None)
 
     def to_dict(self):
         """Convert event to dictionary for saving"""
-        return {
+        data = {
             "id": self.id,
             "title": self.title,
             "start_time": self.start_time,
             "end_time": self.end_time,
             "location": self.location,
             "description": self.description,
-            "keywords": self.keywords
+            "keywords": self.keywords,
+            "version": self.version
         }
+        # Only recurring events carry the key, so one-off events stay compact
+        if self.recurrence is not None:
+            data["recurrence"] = self.recurrence.to_dict()
+        return data
+
+    @classmethod
+    def from_fields(cls, event_id, version, title, start_time, start_minutes, end_time, end_minutes,
+                    location, description, keywords, recurrence=None):
+        """Create an event from already decoded fields, without validating or re-parsing the times
+
+        For snapshot readers that store times both as text and as minutes.
+        """
+        event = cls.__new__(cls)
+        event.id = event_id
+        event.version = version
+        event.title = title
+        event._start_time = start_time
+        event.start_minutes = start_minutes
+        event._end_time = end_time
+        event.end_minutes = end_minutes
+        event.location = location
+        event.description = description
+        event.keywords = keywords
+        event.recurrence = recurrence
+        return event
 
     @classmethod
     def from_dict(cls, data):
         """Create event from dictionary"""
         # Basic validation for essential fields from dict
         if not data.get("title") or not data.get("start_time"):
-             logging.warning(f"Skipping event data due to missing title or start_time: {data.get('id', 'N/A')}")
+             logger.warning("Skipping event data due to missing title or start_time: %s", data.get('id', 'N/A'))
              return None # Indicate failure to create event
 
         event = cls(
@@ -141,196 +383,3445 @@ class Event:
             end_time=data.get("end_time"),
             location=data.get("location", ""),
             description=data.get("description", ""),
-            keywords=data.get("keywords", [])
+            keywords=data.get("keywords", []),
+            recurrence=data.get("recurrence")
         )
         event.id = data.get("id") # ID might be missing in older formats or if saving failed
-        # Further validation (like date format) could be added here if needed
-        try:
-            datetime.strptime(event.start_time, "%Y-%m-%d %H:%M")
-            if event.end_time:
-                datetime.strptime(event.end_time, "%Y-%m-%d %H:%M")
-        except ValueError:
-            logging.warning(f"Event {event.id} has invalid date format in loaded data.")
+        event.version = data.get("version", 1)
+        # Times that failed to parse were cached as None
+        if event.start_minutes is None or (event.end_time and event.end_minutes is None):
+            logger.warning("Event %s has invalid date format in loaded data.", event.id)
             # Decide how to handle: skip event, try to fix, or load as is?
             # Loading as is, validation will happen during edit/use.
 
         return event
 
-class Calendar:
+class Recurrence:
+    """RRULE-style repetition rule of a recurring event
+
+    The event repeats every `interval` days, weeks or months (freq "daily",
+    "weekly" or "monthly") from its start. Weekly rules may name the
+    weekdays to repeat on (0 = Monday); monthly rules repeat on the start's
+    day of the month, skipping months that lack it. The series stops after
+    `count` occurrences, after the occurrence starting at or before `until`,
+    or never. `exceptions` lists the start times of cancelled occurrences;
+    like EXDATE, they still count towards `count`.
+
+    Only the rule is stored. Occurrences are generated lazily and only for
+    the window being queried.
+    """
+
+    __slots__ = ("freq", "interval", "count", "until", "until_minutes", "weekdays", "exceptions",
+                 "exception_minutes")
+
+    FREQUENCIES = ("daily", "weekly", "monthly")
+    RRULE_DAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+    OPEN_END = parse_minutes("9999-12-31 23:59")  # Where a never-ending series is indexed to
+
+    def __init__(self, freq, interval=1, count=None, until=None, weekdays=None, exceptions=None):
+        freq = str(freq).lower()
+        if freq not in self.FREQUENCIES:
+            raise ValueError(f"Recurrence frequency must be one of {', '.join(self.FREQUENCIES)}")
+        if not isinstance(interval, int) or interval < 1:
+            raise ValueError("Recurrence interval must be a positive whole number")
+        if count is not None and (not isinstance(count, int) or count < 1):
+            raise ValueError("Recurrence count must be a positive whole number")
+        if weekdays and freq != "weekly":
+            raise ValueError("Weekdays can only be given for weekly recurrence")
+        if weekdays and not all(isinstance(day, int) and 0 <= day <= 6 for day in weekdays):
+            raise ValueError("Weekdays must be numbers from 0 (Monday) to 6 (Sunday)")
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until or None
+        try:
+            self.until_minutes = parse_minutes(until) if until else None
+            self.exceptions = sorted(set(format_minutes(parse_minutes(start)) for start in exceptions or ()))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid date format in recurrence. Use YYYY-MM-DD HH:MM")
+        self.weekdays = tuple(sorted(set(weekdays))) if weekdays else ()
+        self.exception_minutes = frozenset(parse_minutes(start) for start in self.exceptions)
+
+    @classmethod
+    def coerce(cls, value):
+        """Accept a Recurrence, its to_dict() form, an RRULE string or None"""
+        if value is None or isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls.from_dict(value)
+        if isinstance(value, str):
+            return cls.from_rrule(value) if value.strip() else None
+        raise ValueError(f"Invalid recurrence: {value!r}")
+
+    @classmethod
+    def from_rrule(cls, text, exceptions=None):
+        """Parse an RRULE such as 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;COUNT=10'
+
+        FREQ, INTERVAL, COUNT, UNTIL (YYYYMMDD or YYYYMMDDTHHMM[SS]) and, for
+        weekly rules, BYDAY are understood.
+        """
+        parts = {}
+        for part in text.strip().removeprefix("RRULE:").split(";"):
+            key, _, value = part.partition("=")
+            if part:
+                parts[key.strip().upper()] = value.strip().upper()
+        try:
+            until = None
+            if "UNTIL" in parts:
+                raw = parts["UNTIL"].rstrip("Z")
+                day, _, time_of_day = raw.partition("T")
+                until = f"{day[:4]}-{day[4:6]}-{day[6:8]} {(time_of_day or '2359')[:2]}:{(time_of_day or '2359')[2:4]}"
+            weekdays = [cls.RRULE_DAYS.index(day[-2:]) for day in parts["BYDAY"].split(",")] if "BYDAY" in parts else None
+            return cls(parts.get("FREQ", ""), int(parts.get("INTERVAL", 1)),
+                       int(parts["COUNT"]) if "COUNT" in parts else None, until, weekdays, exceptions)
+        except (KeyError, IndexError) as e:
+            raise ValueError(f"Invalid RRULE {text!r}: {e}")
+
+    def to_dict(self):
+        data = {"freq": self.freq, "interval": self.interval}
+        if self.count is not None:
+            data["count"] = self.count
+        if self.until:
+            data["until"] = self.until
+        if self.weekdays:
+            data["weekdays"] = list(self.weekdays)
+        if self.exceptions:
+            data["exceptions"] = list(self.exceptions)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("freq"), data.get("interval", 1), data.get("count"), data.get("until"),
+                   data.get("weekdays"), data.get("exceptions"))
+
+    def with_exception(self, start):
+        """Return a copy of the rule that also skips the occurrence starting at start"""
+        return Recurrence(self.freq, self.interval, self.count, self.until, self.weekdays,
+                          self.exceptions + [start])
+
+    def describe(self):
+        """Short human-readable summary, e.g. 'every 2 weeks, 10 times'"""
+        unit = {"daily": "day", "weekly": "week", "monthly": "month"}[self.freq]
+        text = f"every {unit}" if self.interval == 1 else f"every {self.interval} {unit}s"
+        if self.weekdays:
+            text += " on " + ", ".join(self.RRULE_DAYS[day].title() for day in self.weekdays)
+        if self.count is not None:
+            text += f", {self.count} times"
+        if self.until:
+            text += f", until {self.until}"
+        return text
+
+    def candidates(self, first, after):
+        """Yield (index, start) for occurrences in order, beginning at or shortly before `after`
+
+        index is the occurrence's position in the whole series (for count).
+        Daily and weekly rules jump straight to `after`; monthly rules with a
+        count walk from the first month, since skipped months do not count.
+        """
+        if self.freq == "monthly":
+            first_day, time_of_day = divmod(first, 1440)
+            start_date = date.fromordinal(first_day + EPOCH_ORDINAL)
+            month = start_date.year * 12 + start_date.month - 1
+            step = 0
+            if self.count is None and after > first:
+                after_date = date.fromordinal(after // 1440 + EPOCH_ORDINAL)
+                step = (after_date.year * 12 + after_date.month - 1 - month) // self.interval * self.interval
+            index = 0
+            while True:
+                year, month_index = divmod(month + step, 12)
+                if year > 9999:
+                    return
+                try:
+                    day = date(year, month_index + 1, start_date.day).toordinal() - EPOCH_ORDINAL
+                except ValueError:
+                    step += self.interval # This month has no such day
+                    continue
+                yield index, day * 1440 + time_of_day
+                index += 1
+                step += self.interval
+        elif self.weekdays:
+            first_day, time_of_day = divmod(first, 1440)
+            weekday = (first_day + 3) % 7  # 1970-01-01 was a Thursday
+            monday = first_day - weekday
+            period = 7 * self.interval
+            first_week = [day for day in self.weekdays if day >= weekday]
+            week = max(0, (after // 1440 - monday) // period)
+            index = 0 if week == 0 else len(first_week) + (week - 1) * len(self.weekdays)
+            while True:
+                for day in (first_week if week == 0 else self.weekdays):
+                    yield index, (monday + week * period + day) * 1440 + time_of_day
+                    index += 1
+                week += 1
+        else:
+            step = self.interval * (1440 if self.freq == "daily" else 7 * 1440)
+            index = max(0, (after - first) // step)
+            while True:
+                yield index, first + index * step
+                index += 1
+
+    def starts(self, first, after=None):
+        """Yield the start minute of every occurrence starting at or after `after`, in order
+
+        first is the start of the series; exceptions are not filtered out.
+        """
+        if after is None or after < first:
+            after = first
+        for index, start in self.candidates(first, after):
+            if self.count is not None and index >= self.count:
+                return
+            if self.until_minutes is not None and start > self.until_minutes:
+                return
+            if start > self.OPEN_END:
+                return
+            if start >= after:
+                yield start
+
+    def occurrences(self, first, duration, start, end):
+        """Yield start minutes of the occurrences overlapping [start, end], skipping exceptions"""
+        for occurrence in self.starts(first, start - duration):
+            if occurrence > end:
+                return
+            if occurrence not in self.exception_minutes:
+                yield occurrence
+
+    def span_end(self, first, duration):
+        """Return a minute no earlier than the end of the last occurrence, or None if the series never ends"""
+        if self.count is None:
+            return None if self.until_minutes is None else max(first, self.until_minutes) + duration
+        last = first
+        for last in self.starts(first):
+            pass
+        return last + duration
+
+class Occurrence:
+    """One occurrence of a recurring event, generated on demand by Event.occurrences
+
+    It has its own start and end time; every other attribute (id, title,
+    keywords, recurrence, ...) is read from `series`, the stored event, so
+    edits and deletes by id act on the whole series.
+    """
+
+    __slots__ = ("series", "start_minutes", "end_minutes")
+
+    def __init__(self, series, start_minutes, end_minutes):
+        self.series = series
+        self.start_minutes = start_minutes
+        self.end_minutes = end_minutes
+
+    def __getattr__(self, name):
+        return getattr(self.series, name)
+
+    @property
+    def start_time(self):
+        return format_minutes(self.start_minutes)
+
+    @property
+    def end_time(self):
+        return format_minutes(self.end_minutes) if self.end_minutes is not None else None
+
+    is_all_day = Event.is_all_day
+    is_multi_day = Event.is_multi_day
+
+    def to_dict(self):
+        """The series' dictionary with this occurrence's times and without the rule"""
+        data = self.series.to_dict()
+        data.pop("recurrence", None)
+        data["start_time"] = self.start_time
+        data["end_time"] = self.end_time
+        return data
+
+class EditConflictError(ValueError):
+    """Raised when an event changed (or was deleted) since the caller read the version it expected"""
+
+class ReadOnlyCalendarError(ValueError):
+    """Raised when a change is attempted on a read-only calendar (see MappedCalendar)"""
+
+class EventColumns:
+    """Columnar backing store for events
+
+    Instead of one object per event, every field lives in its own column:
+    ids and start/end minutes in compact arrays, titles and descriptions in
+    lists, and locations/keywords as interned strings. Events are accessed
+    through lightweight EventView objects. Rows of deleted events are not
+    reused; they are reclaimed when the calendar is reloaded.
+    """
+
+    NO_TIME = -(1 << 63)  # Marks a missing or unparsable time in the minute columns
+
     def __init__(self):
-        self.events = []
-        self.next_id = 1
-        self.filename = "calendar_events.json"
-        self.load_events()
+        self.ids = array('q')
+        self.versions = array('q')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.titles = []
+        self.locations = []
+        self.descriptions = []
+        self.keywords = []     # Tuples of interned strings
+        self.raw_times = {}    # (column, row) -> time string that did not parse
+        self.recurrences = {}  # row -> Recurrence; few events recur
 
-    def load_events(self):
-        """Load events from file"""
-        if os.path.exists(self.filename):
-            try:
-                with open(self.filename, 'r') as file:
-                    # Handle empty file case
-                    content = file.read()
-                    if not content:
-                        logging.warning(f"Event file '{self.filename}' is empty.")
-                        self.events = []
-                        self.next_id = 1
-                        return
-
-                    data = json.loads(content)
-                    loaded_events = []
-                    for event_data in data.get("events", []):
-                        event = Event.from_dict(event_data)
-                        if event: # Only add if from_dict was successful
-                            loaded_events.append(event)
-                        else:
-                            logging.warning(f"Failed to load event from data: {event_data}")
-
-                    self.events = loaded_events
-                    # Ensure next_id is at least max(existing_ids) + 1
-                    max_id = 0
-                    for e in self.events:
-                        if e.id is not None and e.id > max_id:
-                            max_id = e.id
-                    self.next_id = max(data.get("next_id", 1), max_id + 1)
-
-            except json.JSONDecodeError as e:
-                logging.error(f"Error decoding JSON from {self.filename}: {e}")
-                self.events = []
-                self.next_id = 1
-            except Exception as e:
-                logging.error(f"Error loading events from {self.filename}: {e}")
-                # Consider backing up the corrupted file here
-                self.events = []
-                self.next_id = 1
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, event):
+        """Copy an event into a new row and return a view of it"""
+        row = len(self.ids)
+        self.ids.append(event.id if event.id is not None else 0)
+        self.versions.append(event.version)
+        self.starts.append(self.NO_TIME)
+        self.ends.append(self.NO_TIME)
+        self.titles.append(event.title)
+        self.locations.append(None)
+        self.descriptions.append(event.description)
+        self.keywords.append(())
+        view = EventView(self, row)
+        view.start_time = event.start_time
+        view.end_time = event.end_time
+        view.location = event.location
+        view.keywords = event.keywords
+        view.recurrence = event.recurrence
+        return view
+
+    def get_time(self, column, row):
+        minutes = (self.starts if column == "start" else self.ends)[row]
+        if minutes == self.NO_TIME:
+            return self.raw_times.get((column, row))
+        return format_minutes(minutes)
+
+    def set_time(self, column, row, value):
+        minutes = optional_minutes(value)
+        (self.starts if column == "start" else self.ends)[row] = self.NO_TIME if minutes is None else minutes
+        if minutes is None and value:
+            self.raw_times[(column, row)] = value
         else:
-            logging.info(f"Event file '{self.filename}' not found. Starting fresh.")
-            self.events = []
-            self.next_id = 1
+            self.raw_times.pop((column, row), None)
 
-    def save_events(self):
-        """Save events to file"""
-        try:
-            with open(self.filename, 'w') as file:
-                # Ensure all events have an ID before saving
-                valid_events = []
-                for event in self.events:
-                    if event.id is None:
-                        logging.warning(f"Event '{event.title}' missing ID before saving. Assigning {self.next_id}.")
-                        event.id = self.next_id
-                        self.next_id += 1
-                    valid_events.append(event.to_dict())
-
-                data = {
-                    "events": valid_events,
-                    "next_id": self.next_id
-                }
-                json.dump(data, file, indent=2)
-        except TypeError as e:
-             logging.error(f"Error serializing event data to JSON: {e}")
-        except Exception as e:
-            logging.error(f"Error saving events to {self.filename}: {e}")
+class EventView:
+    """Event-compatible view of one row of an EventColumns store"""
 
-    @log_action
-    @validate_date_format
-    def add_event(self, title, start_time, end_time=None, location="", description="", keywords=None):
-        """Add a new event to the calendar"""
-        # Basic validation already done in Event.__init__ and decorator
-        # Ensure end time is not earlier than start time if both provided
-        if end_time:
-            try:
-                start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M")
-                end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M")
-                if end_dt < start_dt:
-                    raise ValueError("End time cannot be earlier than start time")
-            except ValueError as e: # Catch parsing error or comparison error
-                 raise ValueError(f"Date validation error: {e}")
+    __slots__ = ("store", "row")
 
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
 
-        event = Event(title, start_time, end_time, location, description, keywords)
-        event.id = self.next_id
-        self.next_id += 1
-        self.events.append(event)
-        # Sort events after adding, e.g., by start time
-        self.events.sort(key=lambda x: x.start_time)
-        self.save_events()
-        return event
+    @property
+    def id(self):
+        event_id = self.store.ids[self.row]
+        return event_id if event_id else None
 
-    @log_action
-    def delete_event(self, event_id):
-        """Delete an event by ID"""
-        initial_length = len(self.events)
-        self.events = [event for event in self.events if event.id != event_id]
-        if len(self.events) < initial_length:
-            self.save_events()
-            logging.info(f"Event with ID {event_id} deleted.")
-            return True
+    @id.setter
+    def id(self, value):
+        self.store.ids[self.row] = value if value is not None else 0
+
+    @property
+    def version(self):
+        return self.store.versions[self.row]
+
+    @version.setter
+    def version(self, value):
+        self.store.versions[self.row] = value
+
+    @property
+    def title(self):
+        return self.store.titles[self.row]
+
+    @title.setter
+    def title(self, value):
+        self.store.titles[self.row] = value
+
+    @property
+    def start_time(self):
+        return self.store.get_time("start", self.row)
+
+    @start_time.setter
+    def start_time(self, value):
+        self.store.set_time("start", self.row, value)
+
+    @property
+    def end_time(self):
+        return self.store.get_time("end", self.row)
+
+    @end_time.setter
+    def end_time(self, value):
+        self.store.set_time("end", self.row, value)
+
+    @property
+    def start_minutes(self):
+        minutes = self.store.starts[self.row]
+        return None if minutes == EventColumns.NO_TIME else minutes
+
+    @property
+    def end_minutes(self):
+        minutes = self.store.ends[self.row]
+        return None if minutes == EventColumns.NO_TIME else minutes
+
+    @property
+    def location(self):
+        return self.store.locations[self.row]
+
+    @location.setter
+    def location(self, value):
+        self.store.locations[self.row] = intern_string(value)
+
+    @property
+    def description(self):
+        return self.store.descriptions[self.row]
+
+    @description.setter
+    def description(self, value):
+        self.store.descriptions[self.row] = value
+
+    @property
+    def keywords(self):
+        return list(self.store.keywords[self.row])
+
+    @keywords.setter
+    def keywords(self, value):
+        self.store.keywords[self.row] = tuple(intern_string(kw) for kw in value) if value else ()
+
+    @property
+    def recurrence(self):
+        return self.store.recurrences.get(self.row)
+
+    @recurrence.setter
+    def recurrence(self, value):
+        value = Recurrence.coerce(value)
+        if value is None:
+            self.store.recurrences.pop(self.row, None)
         else:
-            logging.warning(f"Event with ID {event_id} not found for deletion.")
+            self.store.recurrences[self.row] = value
+
+    # Behaviour is shared with Event; it only relies on the attributes above
+    is_all_day = Event.is_all_day
+    is_multi_day = Event.is_multi_day
+    duration_minutes = Event.duration_minutes
+    span_end_minutes = Event.span_end_minutes
+    occurrences = Event.occurrences
+    to_dict = Event.to_dict
+
+class IntervalIndex:
+    """Time index answering "which events overlap [start, end]" queries
+
+    Events are grouped into duration classes (class c holds durations below
+    2**c minutes) and each class keeps its entries sorted by start minute.
+    An event of class c overlapping the query must start no earlier than
+    query_start - (2**c - 1), so every class is answered with two bisects
+    and a short scan instead of looking at the whole calendar.
+    """
+
+    def __init__(self):
+        self.classes = {}   # duration class -> sorted list of (start, end, id)
+        self.entries = {}   # event id -> (duration class, entry, event)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.classes = {}
+        self.entries = {}
+
+    def add(self, event):
+        """Index an event, replacing any previous entry with the same id"""
+        if event.id in self.entries:
+            self.remove(event.id)
+        found = self.make_entry(event)
+        if found is not None:
+            duration_class, entry = found
+            bisect.insort(self.classes.setdefault(duration_class, []), entry)
+            self.entries[event.id] = (duration_class, entry, event)
+
+    def add_many(self, events):
+        """Index many new events, sorting each touched duration class once"""
+        touched = set()
+        for event in events:
+            if event.id in self.entries:
+                self.remove(event.id)
+            found = self.make_entry(event)
+            if found is not None:
+                duration_class, entry = found
+                self.classes.setdefault(duration_class, []).append(entry)
+                self.entries[event.id] = (duration_class, entry, event)
+                touched.add(duration_class)
+        for duration_class in touched:
+            self.classes[duration_class].sort()
+
+    def make_entry(self, event):
+        """Return (duration class, entry) for an event, or None if it cannot be indexed"""
+        start = event.start_minutes
+        if start is None:
+            logger.warning("Event %s has an invalid start time and is not time-indexed.", event.id)
+            return None
+        # A recurring event is indexed by the span of its whole series
+        end = event.span_end_minutes()
+        return (end - start).bit_length(), (start, end, event.id)
+
+    def remove(self, event_id):
+        """Drop an event from the index, return True if it was indexed"""
+        found = self.entries.pop(event_id, None)
+        if found is None:
             return False
+        duration_class, entry, _ = found
+        entries = self.classes[duration_class]
+        del entries[bisect.bisect_left(entries, entry)]
+        return True
 
-    @log_action
-    @validate_date_format
-    def edit_event(self, event_id, title, start_time, end_time=None, location="", description="", keywords=None):
-        """Edit an existing event"""
-        # Ensure end time is not earlier than start time if both provided
-        if end_time:
-             try:
-                 start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M")
-                 end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M")
-                 if end_dt < start_dt:
-                     raise ValueError("End time cannot be earlier than start time")
-             except ValueError as e: # Catch parsing error or comparison error
-                 raise ValueError(f"Date validation error: {e}")
+    def remove_many(self, event_ids):
+        """Drop many events, filtering each touched duration class once"""
+        touched = set()
+        for event_id in event_ids:
+            found = self.entries.pop(event_id, None)
+            if found is not None:
+                touched.add(found[0])
+        for duration_class in touched:
+            self.classes[duration_class] = [entry for entry in self.classes[duration_class]
+                                            if entry[2] in self.entries]
 
-        for event in self.events:
-            if event.id == event_id:
-                event.title = title
-                event.start_time = start_time
-                event.end_time = end_time
-                event.location = location
-                event.description = description
-                event.keywords = keywords if keywords else []
-                # Re-sort events after editing, e.g., by start time
-                self.events.sort(key=lambda x: x.start_time)
-                self.save_events()
-                logging.info(f"Event with ID {event_id} updated.")
-                return event
-        logging.warning(f"Event with ID {event_id} not found for editing.")
-        return None
+    def overlapping(self, start, end):
+        """Return events overlapping [start, end] (minutes), ordered by start"""
+        matches = []
+        for duration_class, entries in self.classes.items():
+            max_duration = (1 << duration_class) - 1
+            low = bisect.bisect_left(entries, (start - max_duration,))
+            high = bisect.bisect_right(entries, (end, float("inf")))
+            for i in range(low, high):
+                entry = entries[i]
+                if entry[1] >= start:
+                    matches.append(entry)
+        matches.sort()
+        return [self.entries[entry[2]][2] for entry in matches]
 
-    def get_event(self, event_id):
-        """Get an event by ID"""
-        for event in self.events:
-            if event.id == event_id:
-                return event
-        return None
+class KeywordIndex:
+    """Inverted index from normalized keyword to event ids
 
-    def get_upcoming_events(self):
-        """Get all upcoming events (start or end time is in the future)"""
-        # Use string comparison for simplicity, assuming YYYY-MM-DD HH:MM format
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
-        upcoming = []
-        for event in self.events:
-            # Event is upcoming if it starts now or later
-            is_upcoming = event.start_time >= now_str
-            # Or if it has an end time, and that end time is now or later
-            # (This includes events that started in the past but are still ongoing)
-            if not is_upcoming and event.end_time:
-                 is_upcoming = event.end_time >= now_str
-
-            if is_upcoming:
-                upcoming.append(event)
-
-        # Events are already sorted by start time due to add/edit logic
-        # If not guaranteed, sort here: upcoming.sort(key=lambda x: x.start_time)
-        return upcoming
-
-    def get_events_by_keyword(self, keyword):
-        """Get events by keyword (case-insensitive)"""
-        if not keyword: # Return empty list if keyword is empty
+    Distinct keywords are additionally indexed by all their 1..3 character
+    n-grams (for substring matches) and kept in a sorted list (for prefix
+    matches), so a query never has to look at every event's keyword list.
+    The index is built lazily: while `stale` it ignores updates and is
+    rebuilt from scratch on the next query.
+    """
+
+    NGRAM = 3
+
+    def __init__(self):
+        self.stale = True
+        self.clear()
+
+    def clear(self):
+        self.postings = {}        # keyword -> set of event ids
+        self.ngrams = {}          # n-gram -> set of keywords containing it
+        self.sorted_keywords = [] # distinct keywords, for prefix search
+        self.event_keywords = {}  # event id -> set of keywords it was indexed under
+
+    @staticmethod
+    def normalize(keyword):
+        return keyword.lower()
+
+    def build(self, events):
+        """Index all events from scratch"""
+        self.clear()
+        self.stale = False
+        for event in events:
+            self.add(event)
+
+    def add(self, event):
+        """Index an event's keywords, replacing any previous entry with the same id"""
+        if self.stale:
+            return
+        if event.id in self.event_keywords:
+            self.remove(event.id)
+        keywords = {self.normalize(kw) for kw in event.keywords}
+        self.event_keywords[event.id] = keywords
+        for keyword in keywords:
+            ids = self.postings.get(keyword)
+            if ids is None:
+                ids = self.postings[keyword] = set()
+                self.add_keyword(keyword)
+            ids.add(event.id)
+
+    def remove(self, event_id):
+        """Drop an event's keywords from the index"""
+        if self.stale:
+            return
+        for keyword in self.event_keywords.pop(event_id, ()):
+            ids = self.postings[keyword]
+            ids.discard(event_id)
+            if not ids:
+                del self.postings[keyword]
+                self.remove_keyword(keyword)
+
+    def keyword_ngrams(self, keyword):
+        return {keyword[i:i + n]
+                for n in range(1, self.NGRAM + 1)
+                for i in range(len(keyword) - n + 1)}
+
+    def add_keyword(self, keyword):
+        bisect.insort(self.sorted_keywords, keyword)
+        for gram in self.keyword_ngrams(keyword):
+            self.ngrams.setdefault(gram, set()).add(keyword)
+
+    def remove_keyword(self, keyword):
+        del self.sorted_keywords[bisect.bisect_left(self.sorted_keywords, keyword)]
+        for gram in self.keyword_ngrams(keyword):
+            keywords = self.ngrams[gram]
+            keywords.discard(keyword)
+            if not keywords:
+                del self.ngrams[gram]
+
+    def matching_keywords(self, query, match="substring"):
+        """Return the indexed keywords matching a normalized query"""
+        if match == "exact":
+            return [query] if query in self.postings else []
+        if match == "prefix":
+            start = bisect.bisect_left(self.sorted_keywords, query)
+            end = bisect.bisect_left(self.sorted_keywords, query + "\U0010ffff")
+            return self.sorted_keywords[start:end]
+        if match != "substring":
+            raise ValueError(f"Unknown keyword match mode: {match}")
+        if len(query) <= self.NGRAM:
+            # Short queries are n-grams themselves: an exact lookup
+            return list(self.ngrams.get(query, ()))
+        # Intersect the trigram candidates, smallest set first, then verify
+        grams = sorted((self.ngrams.get(query[i:i + self.NGRAM], set())
+                        for i in range(len(query) - self.NGRAM + 1)), key=len)
+        candidates = set(grams[0]).intersection(*grams[1:])
+        return [keyword for keyword in candidates if query in keyword]
+
+    def search(self, query, match="substring"):
+        """Return ids of events with a keyword matching the query"""
+        ids = set()
+        for keyword in self.matching_keywords(self.normalize(query), match):
+            ids.update(self.postings[keyword])
+        return ids
+
+class TextIndex:
+    """Positional inverted index over event title, location and description
+
+    Supports BM25-ranked queries with implicit AND between terms, OR between
+    groups of terms and "quoted phrases". Like KeywordIndex it is built
+    lazily while `stale` and then updated incrementally.
+    """
+
+    FIELDS = ("title", "location", "description")
+    TOKEN_RE = re.compile(r"\w+")
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.stale = True
+        self.clear()
+
+    def clear(self):
+        self.postings = {}    # term -> {event id: [positions]}
+        self.doc_terms = {}   # event id -> set of terms, for removal
+        self.doc_lengths = {} # event id -> number of tokens
+        self.total_length = 0
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.TOKEN_RE.findall(text.lower()) if text else []
+
+    def build(self, events):
+        """Index all events from scratch"""
+        self.clear()
+        self.stale = False
+        for event in events:
+            self.add(event)
+
+    def add(self, event):
+        """Index an event's text fields, replacing any previous entry with the same id"""
+        if self.stale:
+            return
+        if event.id in self.doc_terms:
+            self.remove(event.id)
+        position = 0
+        terms = set()
+        for field in self.FIELDS:
+            for token in self.tokenize(getattr(event, field)):
+                self.postings.setdefault(token, {}).setdefault(event.id, []).append(position)
+                terms.add(token)
+                position += 1
+            position += 1 # Gap so phrases never match across fields
+        self.doc_terms[event.id] = terms
+        self.doc_lengths[event.id] = position
+        self.total_length += position
+
+    def remove(self, event_id):
+        """Drop an event from the index"""
+        if self.stale or event_id not in self.doc_terms:
+            return
+        for term in self.doc_terms.pop(event_id):
+            docs = self.postings[term]
+            del docs[event_id]
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(event_id)
+
+    @classmethod
+    def parse_query(cls, query):
+        """Parse a query into OR-groups of AND-ed clauses, each clause a list of terms"""
+        groups = [[]]
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+            if word == "OR":
+                groups.append([])
+                continue
+            if word == "AND":
+                continue
+            terms = cls.tokenize(phrase if phrase else word)
+            if terms:
+                groups[-1].append(terms)
+        return [group for group in groups if group]
+
+    def clause_matches(self, terms):
+        """Return ids of events containing all terms as a consecutive phrase"""
+        postings = [self.postings.get(term) for term in terms]
+        if not all(postings):
+            return set()
+        postings.sort(key=len)
+        ids = set(postings[0]).intersection(*postings[1:])
+        if len(terms) == 1:
+            return ids
+        return {event_id for event_id in ids if self.has_phrase(event_id, terms)}
+
+    def has_phrase(self, event_id, terms):
+        following = [set(self.postings[term][event_id]) for term in terms[1:]]
+        return any(all(start + offset + 1 in positions for offset, positions in enumerate(following))
+                   for start in self.postings[terms[0]][event_id])
+
+    def search(self, query, limit=None):
+        """Return (event id, score) pairs for the query, best match first"""
+        matches = set()
+        query_terms = set()
+        for group in self.parse_query(query):
+            clauses = sorted((self.clause_matches(terms) for terms in group), key=len)
+            matches.update(clauses[0].intersection(*clauses[1:]))
+            for terms in group:
+                query_terms.update(terms)
+        if not matches:
             return []
-        keyword_lower = keyword.lower()
-        return [event for event in self.events if any(keyword_lower in kw.lower() for kw in event.keywords)]
 
-# Create a singleton instance of the Calendar
-calendar = Calendar()
\ No newline at end of file
+        doc_count = len(self.doc_lengths)
+        average_length = self.total_length / doc_count
+        scored = []
+        for event_id in matches:
+            score = 0.0
+            length_norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[event_id] / average_length)
+            for term in query_terms:
+                docs = self.postings.get(term)
+                if not docs or event_id not in docs:
+                    continue
+                tf = len(docs[event_id])
+                idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                score += idf * tf * (self.K1 + 1) / (tf + length_norm)
+            scored.append((score, event_id))
+        # Higher score first, lower id breaks ties
+        key = lambda item: (item[0], -item[1])
+        if limit is None:
+            scored.sort(key=key, reverse=True)
+        else:
+            scored = heapq.nlargest(limit, scored, key=key)
+        return [(event_id, score) for score, event_id in scored]
+
+class JsonStreamReader:
+    """Minimal incremental reader over a JSON text file
+
+    Values are decoded one at a time with the C-accelerated JSONDecoder while
+    the file is read in chunks, so a large document never has to be held in
+    memory as a whole.
+    """
+
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, file, chunk_size=1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        """Append the next chunk to the unread part of the buffer, return False at end of file"""
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character, or '' at end of input"""
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return ""
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of chars, and return it"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value running up to the end of the buffer (e.g. a number)
+                # may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read_more()
+
+def iter_snapshot_events(file, meta):
+    """Yield event dicts from a calendar snapshot's "events" array as they are parsed
+
+    Other top-level keys (next_id, journal_seq, ...) are stored in meta.
+    """
+    reader = JsonStreamReader(file)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "events":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            meta[key] = reader.value()
+        if reader.expect(",}") == "}":
+            return
+
+# Binary snapshot format (all integers little-endian):
+#   header   BINARY_SNAPSHOT_MAGIC, then SNAPSHOT_HEADER: format version,
+#            next_id, journal_seq, number of events
+#   strings  u32 count, then each string as u32 byte length + UTF-8; the
+#            table holds every distinct location and keyword
+#   events   each a u32 byte length + record, in calendar (start time) order
+#   index    (version 2) zero padding to a multiple of 8 bytes, then int64
+#            arrays: the file offset of every record; all ids, sorted, and
+#            the record number of each; the number of duration classes and,
+#            per class (as in IntervalIndex), the class, its size and its
+#            entries' start minutes, span end minutes and record numbers,
+#            sorted by start
+#   trailer  (version 2) int64 file offset of the index; then b"TEND" +
+#            u32 CRC-32 of everything between header and trailer
+# A record is RECORD_HEAD (id, version, start minute, end minute, location
+# string index, keyword count, flags), the keywords' u32 string indexes,
+# the length-prefixed UTF-8 title and description, then, as flagged, the
+# start and end time text (times that are not canonical 'YYYY-MM-DD HH:MM')
+# and the recurrence rule as JSON. A missing end time is NO_TIME.
+BINARY_SNAPSHOT_MAGIC = b"TCALSNAP"
+BINARY_SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct("<HqqI")
+RECORD_HEAD = struct.Struct("<qIqqIHB")
+U32 = struct.Struct("<I")
+I64 = struct.Struct("<q")
+NO_TIME = -(1 << 63)
+RAW_START, RAW_END, RECURRING = 1, 2, 4
+
+def canonical_minutes(text):
+    """Return minutes for a canonical 'YYYY-MM-DD HH:MM' string, None for any other value
+
+    Only canonical strings can be stored as minutes and formatted back unchanged.
+    """
+    if type(text) is str and len(text) == 16 and text[10] == ' ':
+        minutes = TIME_OF_DAY_MINUTES.get(text[11:])
+        if minutes is not None:
+            day = parse_day(text[:10])
+            if day is not None:
+                return day * 1440 + minutes
+    return None
+
+def pack_int64s(values):
+    """Pack integers as a little-endian int64 array"""
+    packed = array('q', values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+def write_binary_snapshot(file, data):
+    """Write snapshot data (as built by Calendar.snapshot_data) to a binary file in the binary format"""
+    strings = {}  # string -> index in the string table
+    records = []
+    offsets = []
+    ids = []
+    classes = {}  # duration class -> [(start, span end, record number)]
+    pos = len(BINARY_SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size
+    pack_head, pack_u32 = RECORD_HEAD.pack, U32.pack
+    for number, event in enumerate(data["events"]):
+        flags = 0
+        extra = []
+        start_time, end_time = event["start_time"], event.get("end_time")
+        start = start_minutes = canonical_minutes(start_time)
+        if start is None:
+            flags |= RAW_START
+            start = NO_TIME
+            start_minutes = optional_minutes(start_time)
+            extra.append(start_time)
+        end = end_minutes = NO_TIME if end_time is None else canonical_minutes(end_time)
+        if end is None:
+            flags |= RAW_END
+            end = NO_TIME
+            end_minutes = optional_minutes(end_time)
+            extra.append(end_time)
+        elif end == NO_TIME:
+            end_minutes = None
+        if event.get("recurrence") is not None:
+            flags |= RECURRING
+            extra.append(json.dumps(event["recurrence"], separators=(',', ':')))
+        location = strings.setdefault(event.get("location") or "", len(strings))
+        keywords = [strings.setdefault(keyword, len(strings)) for keyword in event.get("keywords") or ()]
+        parts = [pack_head(event["id"], event.get("version", 1), start, end, location, len(keywords), flags),
+                 struct.pack(f"<{len(keywords)}I", *keywords)]
+        for text in (event["title"], event.get("description") or "", *extra):
+            encoded = text.encode("utf-8")
+            parts.append(pack_u32(len(encoded)))
+            parts.append(encoded)
+        record = b"".join(parts)
+        records.append(pack_u32(len(record)))
+        records.append(record)
+        offsets.append(pos)
+        pos += 4 + len(record)
+        ids.append((event["id"], number))
+
+        # Index it the way IntervalIndex would
+        if start_minutes is not None:
+            recurrence = event.get("recurrence")
+            if recurrence is not None:
+                span_end = Event.from_fields(None, 1, "", start_time, start_minutes, end_time, end_minutes, "",
+                                             "", [], Recurrence.from_dict(recurrence)).span_end_minutes()
+            else:
+                span_end = start_minutes if end_minutes is None else max(start_minutes, end_minutes)
+            classes.setdefault((span_end - start_minutes).bit_length(), []).append(
+                (start_minutes, span_end, number))
+
+    table = [pack_u32(len(strings))]
+    for text in strings: # Insertion order is index order
+        encoded = text.encode("utf-8")
+        table.append(pack_u32(len(encoded)))
+        table.append(encoded)
+    table = b"".join(table)
+    # Records follow the string table
+    offsets = [offset + len(table) for offset in offsets]
+    pos += len(table)
+
+    padding = b"\0" * (-pos % 8)
+    index_offset = pos + len(padding)
+    ids.sort()
+    index = [pack_int64s(offsets), pack_int64s(event_id for event_id, _ in ids),
+             pack_int64s(number for _, number in ids), I64.pack(len(classes))]
+    for duration_class, entries in sorted(classes.items()):
+        entries.sort()
+        index.append(pack_int64s((duration_class, len(entries))))
+        for column in range(3):
+            index.append(pack_int64s(entry[column] for entry in entries))
+    body = b"".join([table, *records, padding, *index, I64.pack(index_offset)])
+
+    file.write(BINARY_SNAPSHOT_MAGIC)
+    file.write(SNAPSHOT_HEADER.pack(BINARY_SNAPSHOT_VERSION, data["next_id"], data["journal_seq"],
+                                    len(data["events"])))
+    file.write(body)
+    file.write(b"TEND" + pack_u32(zlib.crc32(body)))
+
+def read_binary_strings(data, pos):
+    """Decode the string table starting at data[pos]; return (strings, position after it)"""
+    strings = []
+    for _ in range(U32.unpack_from(data, pos)[0]):
+        pos += 4
+        length = U32.unpack_from(data, pos)[0]
+        strings.append(sys.intern(str(data[pos + 4:pos + 4 + length], "utf-8")))
+        pos += length
+    return strings, pos + 4
+
+def decode_binary_record(data, pos, strings):
+    """Decode the record whose length prefix is at data[pos]; return (Event, position after it)"""
+    end_of_record = pos + 4 + U32.unpack_from(data, pos)[0]
+    event_id, version, start, end, location, keyword_count, flags = RECORD_HEAD.unpack_from(data, pos + 4)
+    pos += 4 + RECORD_HEAD.size
+    if keyword_count:
+        keywords = [strings[i] for i in struct.unpack_from(f"<{keyword_count}I", data, pos)]
+        pos += 4 * keyword_count
+    else:
+        keywords = []
+    texts = []
+    while pos < end_of_record:
+        length = U32.unpack_from(data, pos)[0]
+        pos += 4 + length
+        texts.append(str(data[pos - length:pos], "utf-8"))
+    title, description, *extra = texts
+    extra.reverse()  # Popped in the order they were written
+    if flags & RAW_START:
+        start_time = extra.pop()
+        start = optional_minutes(start_time)
+    else:
+        start_time = format_minutes(start)
+    if flags & RAW_END:
+        end_time = extra.pop()
+        end = optional_minutes(end_time)
+    elif end == NO_TIME:
+        end_time = end = None
+    else:
+        end_time = format_minutes(end)
+    recurrence = Recurrence.from_dict(json.loads(extra.pop())) if flags & RECURRING else None
+    event = Event.from_fields(event_id, version, title, start_time, start, end_time, end,
+                              strings[location], description, keywords, recurrence)
+    return event, end_of_record
+
+def read_binary_header(data):
+    """Validate a binary snapshot's header; return (version, next_id, journal_seq, number of events)"""
+    if bytes(data[:len(BINARY_SNAPSHOT_MAGIC)]) != BINARY_SNAPSHOT_MAGIC:
+        raise ValueError("Not a binary calendar snapshot")
+    if len(data) < len(BINARY_SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size + 8:
+        raise ValueError("Truncated binary snapshot")
+    header = SNAPSHOT_HEADER.unpack_from(data, len(BINARY_SNAPSHOT_MAGIC))
+    if header[0] > BINARY_SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported binary snapshot version {header[0]}")
+    if bytes(data[-8:-4]) != b"TEND":
+        raise ValueError("Truncated binary snapshot")
+    return header
+
+def iter_binary_snapshot_events(file, meta):
+    """Yield Events from a binary snapshot opened in binary mode, storing next_id and journal_seq in meta
+
+    The (compact) file is read at once and its checksum verified before the
+    first event is decoded. Raises ValueError for an unsupported version, a
+    truncated file or a checksum mismatch.
+    """
+    data = memoryview(file.read())
+    version, next_id, journal_seq, count = read_binary_header(data)
+    body_start = len(BINARY_SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size
+    if zlib.crc32(data[body_start:-8]) != U32.unpack_from(data, len(data) - 4)[0]:
+        raise ValueError("Binary snapshot checksum mismatch")
+    meta["next_id"], meta["journal_seq"] = next_id, journal_seq
+
+    strings, pos = read_binary_strings(data, body_start)
+    for _ in range(count):
+        event, pos = decode_binary_record(data, pos, strings)
+        yield event
+    # Version 1 has nothing between the events and the trailer
+    if version == 1 and pos != len(data) - 8:
+        raise ValueError("Binary snapshot has trailing data")
+
+class MappedSnapshot:
+    """Read-only access to a version 2 binary snapshot through mmap
+
+    Opening reads the header, the string table and the positions of the
+    index arrays; the arrays are then used in place, and records are only
+    decoded when asked for. The checksum is not verified, since that would
+    read the whole file.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.views = []  # Every view into the map, released before it is closed
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # An empty file cannot be mapped
+            self.file.close()
+            raise ValueError(f"Snapshot '{path}' is empty")
+        try:
+            self.data = self.view(memoryview(self.map))
+            version, self.next_id, self.journal_seq, self.count = read_binary_header(self.data)
+            if version < 2:
+                raise ValueError(f"Snapshot '{path}' has no index; save it again to add one")
+            self.strings, _ = read_binary_strings(self.data, len(BINARY_SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size)
+            pos = I64.unpack_from(self.data, len(self.data) - 16)[0]
+            self.offsets, pos = self.int64s(pos, self.count)
+            self.ids, pos = self.int64s(pos, self.count)
+            self.id_records, pos = self.int64s(pos, self.count)
+            (class_count,), pos = self.int64s(pos, 1)
+            self.classes = []  # (duration class, starts, span ends, record numbers)
+            for _ in range(class_count):
+                (duration_class, size), pos = self.int64s(pos, 2)
+                starts, pos = self.int64s(pos, size)
+                ends, pos = self.int64s(pos, size)
+                records, pos = self.int64s(pos, size)
+                self.classes.append((duration_class, starts, ends, records))
+        except Exception:
+            self.close()
+            raise
+
+    def view(self, view):
+        self.views.append(view)
+        return view
+
+    def int64s(self, pos, count):
+        """Return (the int64 array of `count` values at pos, the position after it)"""
+        end = pos + 8 * count
+        if pos < 0 or end > len(self.data) - 16:
+            raise ValueError("Corrupt binary snapshot index")
+        if sys.byteorder != "little":
+            values = array('q', self.data[pos:end].tobytes())
+            values.byteswap()
+            return values, end
+        return self.view(self.data[pos:end].cast('q')), end
+
+    def record(self, number):
+        """Decode the event stored as record `number`"""
+        return decode_binary_record(self.data, self.offsets[number], self.strings)[0]
+
+    def find(self, event_id):
+        """Return the record number of the event with event_id, or None"""
+        i = bisect.bisect_left(self.ids, event_id)
+        if i < self.count and self.ids[i] == event_id:
+            return self.id_records[i]
+        return None
+
+    def overlapping(self, start, end):
+        """Return the record numbers of events overlapping [start, end] (minutes), ordered by start"""
+        matches = []
+        for duration_class, starts, ends, records in self.classes:
+            # Same bounds as IntervalIndex.overlapping
+            low = bisect.bisect_left(starts, start - ((1 << duration_class) - 1))
+            high = bisect.bisect_right(starts, end)
+            for i in range(low, high):
+                if ends[i] >= start:
+                    matches.append((starts[i], ends[i], records[i]))
+        matches.sort()
+        return [number for _, _, number in matches]
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        if getattr(self, "map", None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+def is_binary_snapshot(path):
+    """Check whether a snapshot file is in the binary format (otherwise it is JSON)"""
+    with open(path, 'rb') as file:
+        return file.read(len(BINARY_SNAPSHOT_MAGIC)) == BINARY_SNAPSHOT_MAGIC
+
+SNAPSHOT_FORMATS = ("json", "binary")
+
+def convert_snapshot(source, destination, snapshot_format="binary"):
+    """Write the calendar stored at `source` (either format, journal included) to `destination` as snapshot_format
+
+    Returns the number of events written.
+    """
+    calendar = Calendar(source, backup_count=0)
+    target = Calendar(destination, autoload=False, backup_count=0, snapshot_format=snapshot_format)
+    data = calendar.snapshot_data()
+    target.write_snapshot(data)
+    return len(data["events"])
+
+class ReadWriteLock:
+    """Lock held by many readers at once or by a single writer
+
+    Writers are preferred: once one is waiting, new readers queue behind it,
+    so a steady stream of queries cannot starve a mutation. The write side is
+    re-entrant, a thread holding it may also read, and nested reads never
+    wait. Used directly as a context manager it is the write lock.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None         # Ident of the thread holding the write lock
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()  # Per-thread read nesting depth
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth or self._writer == threading.get_ident():
+            # Already reading or writing on this thread: waiting could deadlock
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+        with self._condition:
+            while self._writer is not None or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    def acquire(self):
+        """Take the write lock"""
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            if getattr(self._local, "depth", 0):
+                raise RuntimeError("Cannot take the write lock while holding the read lock")
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release(self):
+        with self._condition:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+def lock_file(file):
+    """Take an exclusive advisory lock on an open file, waiting for other processes to release it"""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass # LK_LOCK gives up after ~10 seconds; keep waiting
+
+def unlock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def file_signature(path):
+    """Return (inode, size, mtime) identifying the current contents of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def fsync_directory(path):
+    """Flush a directory entry (e.g. after a rename) to disk where the platform allows it"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return # Directories cannot be opened on Windows
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class LatencyHistogram:
+    """Histogram of durations with fixed, exponentially spaced buckets (1 us to about 67 s)"""
+
+    BOUNDS = [1e-6 * 2 ** k for k in range(27)]  # Upper bounds in seconds; a last bucket catches the rest
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds, error=False):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Estimate the q-quantile, interpolating within its bucket as Prometheus does"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                if i == len(self.BOUNDS):
+                    return self.max
+                lower = self.BOUNDS[i - 1] if i else 0.0
+                return min(self.max, lower + (self.BOUNDS[i] - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "errors": self.errors, "total_s": self.total,
+                "mean_s": self.total / self.count if self.count else None,
+                "p50_s": self.quantile(0.5), "p90_s": self.quantile(0.9), "p99_s": self.quantile(0.99),
+                "max_s": self.max}
+
+class Metrics:
+    """Operation latency histograms and counters of an instrumented Calendar"""
+
+    def __init__(self):
+        self.histograms = {}  # operation name -> LatencyHistogram
+        self.counters = {}    # e.g. snapshot_bytes, journal_records
+        self._lock = threading.Lock()  # Operations finish on many threads
+
+    def observe(self, operation, seconds, error=False):
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = LatencyHistogram()
+            histogram.add(seconds, error)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def snapshot(self):
+        """Return {"operations": {name: summary}, "counters": {...}}"""
+        with self._lock:
+            return {"operations": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+                    "counters": dict(sorted(self.counters.items()))}
+
+    def prometheus(self, gauges, prefix="calendar"):
+        """Render the metrics and the given gauges in the Prometheus text exposition format"""
+        lines = [f"# HELP {prefix}_operation_seconds Latency of Calendar operations.",
+                 f"# TYPE {prefix}_operation_seconds histogram"]
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, n in zip(LatencyHistogram.BOUNDS, histogram.buckets):
+                    cumulative += n
+                    lines.append(f'{prefix}_operation_seconds_bucket{{operation="{name}",le="{bound:.6g}"}} {cumulative}')
+                lines.append(f'{prefix}_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_operation_seconds_sum{{operation="{name}"}} {histogram.total!r}')
+                lines.append(f'{prefix}_operation_seconds_count{{operation="{name}"}} {histogram.count}')
+            lines.append(f"# HELP {prefix}_operation_errors_total Calendar operations that raised.")
+            lines.append(f"# TYPE {prefix}_operation_errors_total counter")
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f'{prefix}_operation_errors_total{{operation="{name}"}} {histogram.errors}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted(gauges.items()):
+            if value is not None:
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {int(value)}")
+        return "\n".join(lines) + "\n"
+
+class Calendar:
+    """Calendar of events held in memory and persisted to a JSON file
+
+    Storage backends subclass Calendar and override its storage hooks:
+    load_events_progressively, save_events, record_change, get_event,
+    get_all_events, events_overlapping, get_events_by_keyword, search and the
+    in-memory bookkeeping (index_event(s), unindex_event(s), insert_ordered,
+    remove_from_list). See SqliteCalendar.
+
+    Callbacks registered with subscribe() are told about every add, edit and
+    delete, so views can patch just the affected events instead of
+    re-reading the whole calendar.
+
+    With background_save=True a mutation only marks the calendar dirty; a
+    worker thread writes the snapshot once no change has arrived for
+    save_delay seconds (or at the latest max_save_delay seconds after the
+    first unsaved change). Call flush() or close() to write pending changes;
+    an exit hook does so at interpreter shutdown.
+
+    snapshot_format selects how snapshots are written: "json" (the default,
+    human-readable) or "binary", a compact length-prefixed format (see
+    write_binary_snapshot). Either is read regardless of the setting, so
+    switching a calendar's format converts its file on the next save.
+
+    Snapshots are written to a temporary file, fsynced and renamed over the
+    events file, so readers only ever see a complete snapshot. The previous
+    backup_count snapshots are kept as <filename>.1 (newest) to .N; when the
+    events file cannot be read, loading falls back to the newest valid one.
+
+    With shared=True several processes can use the same file. Loads, saves
+    and mutations hold an advisory lock on <filename>.lock; every mutation
+    first checks (by inode, size and mtime) whether another process wrote
+    and, if so, merges its new journal records or reloads the snapshot.
+    Changes still waiting for a background save are re-applied on top of
+    what the other process wrote; new event ids are reserved in
+    <filename>.ids, so they never collide and never change. reload_if_changed() runs the same check
+    on demand, e.g. from a polling timer. edit_event and delete_event take
+    an optional expected_version for optimistic concurrency checks.
+
+    With instrumented=True the public operations record their latency in
+    self.metrics, and snapshot and journal writes count their bytes; see
+    stats() and prometheus_metrics().
+
+    Mutations always run one at a time under the calendar's ReadWriteLock.
+    With thread_safe=True queries take its read side as well, so a calendar
+    can be shared by a pool of threads: queries run concurrently with each
+    other but never see a half-applied change, ids are allocated under the
+    write lock, and get_all_events returns a copy instead of the live list.
+    """
+
+    RECURRENCE_HORIZON = 366 * 1440  # How far open-ended queries expand recurring events
+    read_only = False  # Mutations raise ReadOnlyCalendarError when set
+
+    def __init__(self, filename="calendar_events.json", journaled=False, compact_threshold=1000,
+                 columnar=False, autoload=True, background_save=False, save_delay=0.5, max_save_delay=5.0,
+                 backup_count=3, shared=False, thread_safe=False, instrumented=False, snapshot_format="json"):
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"snapshot_format must be one of {', '.join(SNAPSHOT_FORMATS)}")
+        self.snapshot_format = snapshot_format
+        self.events = []
+        self.metrics = Metrics() if instrumented else None
+        self.next_id = 1
+        self.filename = filename
+        self.events_by_id = {}  # event id -> event, kept in step with self.events
+        self.time_index = IntervalIndex()
+        self.keyword_index = KeywordIndex()
+        self.text_index = TextIndex()
+        # Journaled mode: every mutation appends one compact record to the
+        # journal instead of rewriting the whole file. The journal is folded
+        # back into the snapshot by a background compaction.
+        self.journaled = journaled
+        self.journal_filename = self.filename + ".journal"
+        self.backup_count = backup_count
+        # Multi-process mode: what the files looked like when we last read or
+        # wrote them, and the changes not yet written to the snapshot
+        self.shared = shared
+        self.lock_filename = self.filename + ".lock"
+        self.ids_filename = self.filename + ".ids"  # Next id no process has reserved, see allocate_ids
+        self._lock_file = None
+        self._file_lock_depth = 0
+        self._file_lock_mutex = threading.RLock()
+        self.seen_snapshot = None
+        self.seen_journal = None
+        self.journal_offset = 0   # Bytes of the journal already applied
+        self.unsaved_records = []
+        self.compact_threshold = compact_threshold
+        self.journal_seq = 0        # Sequence number of the last journal record
+        self.journal_records = 0    # Records appended since the last compaction
+        self._journal_file = None
+        self._journal_lock = threading.Lock()
+        self._compaction_thread = None
+        self.ordering_deferred = 0  # Nesting depth of deferred_ordering() blocks
+        # Columnar mode keeps event fields in an EventColumns store and
+        # self.events holds EventView objects instead of Events
+        self.columnar = columnar
+        self.columns = None
+        self.listeners = []  # Change callbacks, see subscribe()
+        # Write side held by every mutation, and by save_events while it
+        # captures a snapshot; read side held by queries in thread-safe mode
+        self.thread_safe = thread_safe
+        self._state_lock = ReadWriteLock()
+        self._index_lock = threading.Lock()  # Serializes lazy index builds by readers
+        # Background saves: the dirty flag and its debounce deadline are
+        # guarded by _save_condition, which also wakes the worker
+        self.background_save = background_save
+        self.save_delay = save_delay
+        self.max_save_delay = max_save_delay
+        self.dirty = False
+        self._dirty_since = 0.0
+        self._save_due = 0.0
+        self._saving = False
+        self._stopping = False
+        self._save_condition = threading.Condition()
+        self._save_thread = None
+        self.loaded = False
+        if autoload:
+            self.load_events()
+
+    @measured
+    def load_events(self):
+        """Load events from file"""
+        for _ in self.load_events_progressively():
+            pass
+
+    def load_events_progressively(self, batch_size=1000):
+        """Load events from file, yielding each batch of events as soon as it is parsed
+
+        The snapshot is parsed incrementally instead of being read and decoded
+        as a whole, so callers (e.g. the GUI) can show the first events before
+        the rest of the file is in memory. self.events grows batch by batch in
+        file order; the journal is replayed and the indexes are built after
+        the last batch, at which point `loaded` becomes True.
+
+        If the events file is missing, empty or corrupt, the newest readable
+        backup is loaded instead and the bad file is moved to <filename>.corrupt.
+        """
+        # Another process must not replace the files while they are read
+        with self.file_lock():
+            self.loaded = False
+            self.journal_seq = 0
+            self.unsaved_records = []
+            self.events = []
+            self.next_id = 1
+            if self.columnar:
+                self.columns = EventColumns()
+            candidates = [path for path in [self.filename] + self.backup_filenames() if os.path.exists(path)]
+            if not candidates:
+                logger.info("Event file '%s' not found. Starting fresh.", self.filename)
+            for path in candidates:
+                try:
+                    if os.path.getsize(path) == 0:
+                        # A file truncated to nothing; an older snapshot may still be intact
+                        logger.warning("Event file '%s' is empty.", path)
+                        continue
+                    yield from self.read_snapshot(path, batch_size)
+                    if path != self.filename:
+                        logger.warning("Recovered %s event(s) from backup '%s'.", len(self.events), path)
+                        self.set_aside_corrupt()
+                    break
+                except json.JSONDecodeError as e:
+                    logger.error("Error decoding JSON from %s: %s", path, e)
+                except Exception as e:
+                    logger.error("Error loading events from %s: %s", path, e)
+                # Drop whatever was read before the error and try the next backup.
+                # Batches already yielded from the bad file are superseded too.
+                self.events = []
+                self.next_id = 1
+                self.journal_seq = 0
+                if self.columnar:
+                    self.columns = EventColumns()
+
+            # Events from older formats may lack an id; every event needs one to be indexed
+            for event in self.events:
+                if event.id is None:
+                    event.id = self.next_id
+                    self.next_id += 1
+            self.events_by_id = {event.id: event for event in self.events}
+
+            # Replay journal records written after the snapshot. This is done even
+            # when not in journaled mode so no acknowledged change is ever lost.
+            replayed = self.replay_journal()
+            if replayed:
+                self.events = list(self.events_by_id.values())
+                logger.info("Replayed %s journal record(s) from '%s'.", replayed, self.journal_filename)
+            self.events.sort(key=start_order)
+            self.rebuild_indexes()
+            self.mark_synced()
+            self.loaded = True
+
+    def read_snapshot(self, path, batch_size):
+        """Parse one snapshot file into self.events, yielding each batch as it is parsed"""
+        meta = {}
+        max_id = 0
+        batch = []
+        # The format is detected per file, so either kind (or a backup of the
+        # other kind) loads whatever snapshot_format the calendar writes
+        if is_binary_snapshot(path):
+            file = open(path, 'rb')
+            events = iter_binary_snapshot_events(file, meta)
+        else:
+            file = open(path, 'r')
+            events = (Event.from_dict(event_data) for event_data in iter_snapshot_events(file, meta))
+        with file:
+            for event in events:
+                if event: # Only add if from_dict was successful
+                    batch.append(self.adopt(event))
+                    if event.id is not None and event.id > max_id:
+                        max_id = event.id
+                else:
+                    logger.warning("Failed to load an event from '%s'.", path)
+                if len(batch) >= batch_size:
+                    self.events.extend(batch)
+                    yield batch
+                    batch = []
+        self.events.extend(batch)
+        if batch:
+            yield batch
+
+        # Ensure next_id is at least max(existing_ids) + 1
+        self.next_id = max(meta.get("next_id", 1), max_id + 1)
+        self.journal_seq = meta.get("journal_seq", 0)
+
+    def backup_filenames(self):
+        """Return the snapshot backup paths, newest first"""
+        return [f"{self.filename}.{n}" for n in range(1, self.backup_count + 1)]
+
+    def set_aside_corrupt(self):
+        """Move an unreadable events file out of the way so it is neither overwritten nor rotated into the backups"""
+        if os.path.exists(self.filename):
+            try:
+                os.replace(self.filename, self.filename + ".corrupt")
+                logger.warning("Moved unreadable '%s' to '%s.corrupt'.", self.filename, self.filename)
+            except OSError as e:
+                logger.error("Could not move unreadable '%s' aside: %s", self.filename, e)
+
+    @contextmanager
+    def file_lock(self):
+        """Hold the advisory lock on <filename>.lock in shared mode (re-entrant; a no-op otherwise)
+
+        The events file itself is replaced on every save, so the lock lives on
+        a separate file that is never renamed.
+
+        The lock keeps other processes out; it is shared by every thread of
+        this one, which coordinate through _state_lock and _journal_lock. A
+        background save can thus hold it for a slow write while mutations on
+        other threads carry on in memory.
+        """
+        if not self.shared:
+            yield
+            return
+        # The mutex only guards taking and dropping the OS lock, never the block
+        with self._file_lock_mutex:
+            if not self._file_lock_depth:
+                lock = open(self.lock_filename, 'a+')
+                try:
+                    lock_file(lock)
+                except BaseException:
+                    lock.close()
+                    raise
+                self._lock_file = lock
+            self._file_lock_depth += 1
+        try:
+            yield
+        finally:
+            with self._file_lock_mutex:
+                self._file_lock_depth -= 1
+                if not self._file_lock_depth:
+                    unlock_file(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def mark_synced(self):
+        """Remember the files as they are now, i.e. as this process last read or wrote them"""
+        self.seen_snapshot = file_signature(self.filename)
+        self.seen_journal = file_signature(self.journal_filename)
+        if self.seen_journal is None:
+            self.journal_offset = 0 # A new journal is read from its start
+
+    def disk_changed(self):
+        """Check whether the events file or journal changed since this process last read or wrote them"""
+        return (file_signature(self.filename) != self.seen_snapshot
+                or file_signature(self.journal_filename) != self.seen_journal)
+
+    def reload_if_changed(self):
+        """Pick up changes another process wrote, returning whether there were any
+
+        When only new journal records were appended, just those are applied;
+        anything else (a new snapshot, a compacted journal) reloads the file.
+        Subscribers then get a "reloaded" notification.
+
+        While this process is writing the files itself the check is skipped
+        rather than waited for: the save merges whatever other processes
+        wrote before it, and the next check picks up anything later.
+        """
+        reloader = self.reload_progressively()
+        while True:
+            try:
+                next(reloader)
+            except StopIteration as stop:
+                return stop.value
+
+    def reload_progressively(self, batch_size=1000):
+        """Generator form of reload_if_changed for event loops; returns whether anything changed
+
+        A new snapshot is re-read batch by batch, as by load_events_progressively,
+        with `loaded` False until the unsaved changes have been re-applied.
+        The locks are held until the generator finishes, so the caller must
+        run it to the end before mutating or saving the calendar.
+        """
+        with self.file_lock(), self._state_lock:
+            if not self.loaded:
+                return False
+            # Held by saves and compactions from capture until mark_synced
+            if not self._journal_lock.acquire(blocking=False):
+                return False
+            try:
+                if not self.disk_changed():
+                    return False
+                journal = file_signature(self.journal_filename)
+                journal_grew = journal is not None and (
+                    self.seen_journal is None
+                    or (journal[0] == self.seen_journal[0] and journal[1] > self.seen_journal[1]))
+                if file_signature(self.filename) == self.seen_snapshot and journal_grew:
+                    self.merge_journal()
+                else:
+                    yield from self.reload_keeping_unsaved_progressively(batch_size)
+            finally:
+                self._journal_lock.release()
+        self.notify("reloaded", [])
+        return True
+
+    def merge_journal(self):
+        """Apply the journal records appended since this process last read the journal"""
+        applied = 0
+        with open(self.journal_filename, 'rb') as file:
+            file.seek(self.journal_offset)
+            for line in file:
+                if not line.strip():
+                    self.journal_offset += len(line)
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break # Torn by a crashed writer; the next full load cuts it off
+                self.journal_offset += len(line)
+                if record.get("seq", 0) <= self.journal_seq:
+                    continue
+                self.apply_journal_record(record)
+                self.journal_seq = record["seq"]
+                applied += 1
+        if applied:
+            self.events = sorted(self.events_by_id.values(), key=start_order)
+            self.rebuild_indexes()
+            logger.info("Merged %s journal record(s) written by another process.", applied)
+        self.mark_synced()
+
+    def reload_keeping_unsaved(self):
+        """Reload the file and re-apply the changes this process has not saved yet"""
+        for _ in self.reload_keeping_unsaved_progressively():
+            pass
+
+    def reload_keeping_unsaved_progressively(self, batch_size=1000):
+        """reload_keeping_unsaved, yielding each batch of events as the file is parsed"""
+        records = self.unsaved_records
+        yield from self.load_events_progressively(batch_size)
+        if not records:
+            return
+        new_ids = {}
+        for record in records:
+            if record["op"] == "add":
+                for data in record.get("events", [record.get("event")]):
+                    if data["id"] in self.events_by_id:
+                        # Ids are reserved across processes (see allocate_ids), so
+                        # only a file written without reserving them can collide
+                        new_ids[data["id"]] = new_id = self.allocate_ids(1)
+                        logger.warning("Event id %s was also used by another writer of '%s'; renumbered to %s.",
+                                       data["id"], self.filename, new_id)
+                        data["id"] = new_id
+            elif record["op"] == "edit":
+                data = record["event"]
+                data["id"] = new_ids.get(data["id"], data["id"])
+                if data["id"] not in self.events_by_id:
+                    logger.warning("Dropping edit of event %s, deleted by another process.", data['id'])
+                    continue
+            elif "ids" in record:
+                record["ids"] = [new_ids.get(event_id, event_id) for event_id in record["ids"]]
+            else:
+                record["id"] = new_ids.get(record["id"], record["id"])
+            self.apply_journal_record(record)
+        self.events = sorted(self.events_by_id.values(), key=start_order)
+        self.rebuild_indexes()
+        self.unsaved_records = records
+        logger.info("Reloaded '%s' written by another process; re-applied %s unsaved change(s).", self.filename, len(records))
+
+    def adopt(self, event):
+        """Return the object the calendar stores for a new event (a view in columnar mode)"""
+        if self.columns is None:
+            return event
+        return self.columns.append(event)
+
+    def rebuild_indexes(self):
+        """Rebuild the lookup indexes from self.events"""
+        self.events_by_id = {event.id: event for event in self.events}
+        self.time_index.clear()
+        for event in self.events:
+            self.time_index.add(event)
+        # The search indexes are rebuilt on their first query
+        self.keyword_index.stale = True
+        self.text_index.stale = True
+
+    def index_event(self, event):
+        """Add or refresh an event in every index"""
+        self.events_by_id[event.id] = event
+        self.time_index.add(event)
+        self.keyword_index.add(event)
+        self.text_index.add(event)
+
+    def unindex_event(self, event_id):
+        """Remove an event from every index"""
+        self.events_by_id.pop(event_id, None)
+        self.time_index.remove(event_id)
+        self.keyword_index.remove(event_id)
+        self.text_index.remove(event_id)
+
+    def index_events(self, events):
+        """Add many new events to the ordered list and every index"""
+        with self.deferred_ordering():
+            self.events.extend(events)
+        for event in events:
+            self.events_by_id[event.id] = event
+            self.keyword_index.add(event)
+            self.text_index.add(event)
+        self.time_index.add_many(events)
+
+    def unindex_events(self, event_ids):
+        """Remove many events from the ordered list and every index"""
+        for event_id in event_ids:
+            del self.events_by_id[event_id]
+            self.keyword_index.remove(event_id)
+            self.text_index.remove(event_id)
+        self.time_index.remove_many(event_ids)
+        # One filtering pass, updating the list in place for existing references
+        self.events[:] = [event for event in self.events if event.id in self.events_by_id]
+
+    def replay_journal(self):
+        """Apply journal records newer than the loaded snapshot, return how many were applied"""
+        applied = 0
+        self.journal_records = 0
+        self.journal_offset = 0
+        # A compaction interrupted by a crash leaves its rotated journal behind
+        for path in (self.journal_filename + ".old", self.journal_filename):
+            if not os.path.exists(path):
+                continue
+            valid_size = 0
+            torn = False
+            with open(path, 'rb') as file:
+                for line_no, line in enumerate(file, 1):
+                    if not line.strip():
+                        valid_size += len(line)
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Only the last line can be torn by a crash mid-append
+                        logger.warning("Ignoring truncated journal record at %s:%s.", path, line_no)
+                        torn = True
+                        break
+                    valid_size += len(line)
+                    self.journal_records += 1
+                    if record.get("seq", 0) <= self.journal_seq:
+                        continue # Already part of the snapshot
+                    self.apply_journal_record(record)
+                    self.journal_seq = record["seq"]
+                    applied += 1
+            if torn:
+                # Cut the torn tail so later appends start on a clean line
+                with open(path, 'r+b') as file:
+                    file.truncate(valid_size)
+            if path == self.journal_filename:
+                self.journal_offset = valid_size
+        return applied
+
+    def apply_journal_record(self, record):
+        """Apply a single journal record to the in-memory events"""
+        # Replay works on the id index only; the ordered list is rebuilt afterwards
+        if record.get("op") == "delete":
+            for event_id in record.get("ids", [record.get("id")]):
+                self.events_by_id.pop(event_id, None)
+            return
+        for event_data in record.get("events", [record.get("event")]):
+            event = Event.from_dict(event_data)
+            if event is None:
+                continue
+            event = self.adopt(event)
+            self.events_by_id[event.id] = event
+            if event.id is not None and event.id >= self.next_id:
+                self.next_id = event.id + 1
+
+    def snapshot_data(self):
+        """Build the serializable snapshot of the calendar"""
+        # Ensure all events have an ID before saving
+        valid_events = []
+        for event in self.events:
+            if event.id is None:
+                logger.warning("Event '%s' missing ID before saving. Assigning %s.", event.title, self.next_id)
+                event.id = self.next_id
+                self.next_id += 1
+            valid_events.append(event.to_dict())
+
+        return {
+            "events": valid_events,
+            "next_id": self.next_id,
+            "journal_seq": self.journal_seq
+        }
+
+    def write_snapshot(self, data, indent=2):
+        """Atomically replace the events file with a new snapshot, keeping the previous ones as backups"""
+        temp_filename = self.write_temp_snapshot(self.filename, data, indent)
+        self.rotate_backups()
+        os.replace(temp_filename, self.filename)
+        fsync_directory(os.path.dirname(os.path.abspath(self.filename)))
+
+    def write_temp_snapshot(self, path, data, indent=2, snapshot_format=None):
+        """Write a snapshot to <path>.tmp and fsync it, returning the temporary path for the caller to rename"""
+        snapshot_format = snapshot_format or self.snapshot_format
+        temp_filename = path + ".tmp"
+        with open(temp_filename, 'wb' if snapshot_format == "binary" else 'w') as file:
+            if snapshot_format == "binary":
+                write_binary_snapshot(file, data)
+            else:
+                json.dump(data, file, indent=indent)
+            # The data must be on disk before the rename makes it visible
+            file.flush()
+            os.fsync(file.fileno())
+            if self.metrics is not None:
+                self.metrics.count("snapshots")
+                self.metrics.count("snapshot_bytes", file.tell())
+        return temp_filename
+
+    def rotate_backups(self):
+        """Shift <filename>.1 .. .N-1 down by one and make the current events file <filename>.1"""
+        if not self.backup_count or not os.path.exists(self.filename):
+            return
+        backups = self.backup_filenames()
+        for older, newer in zip(reversed(backups), reversed(backups[:-1])):
+            if os.path.exists(newer):
+                os.replace(newer, older)
+        newest = backups[0]
+        if os.path.exists(newest):
+            os.remove(newest)
+        try:
+            # A hard link keeps the events file in place for concurrent readers
+            os.link(self.filename, newest)
+        except OSError:
+            shutil.copyfile(self.filename, newest)
+
+    @measured
+    def save_events(self):
+        """Save events to file, returning whether the save succeeded"""
+        # Never race a background compaction writing the same snapshot
+        if self.compaction_running():
+            self._compaction_thread.join()
+        reloaded = False
+        try:
+            with self.file_lock():
+                # Take the journal lock before mutations may continue, so snapshots
+                # captured on different threads reach the disk in capture order.
+                # Only the capture holds the state lock; mutations go on during
+                # the write, which never takes it again.
+                with self._state_lock:
+                    self._journal_lock.acquire()
+                    try:
+                        if self.shared and self.disk_changed():
+                            # Never overwrite what another process wrote: merge it first
+                            self.reload_keeping_unsaved()
+                            reloaded = True
+                        data = self.snapshot_data()
+                        saved_records = len(self.unsaved_records)
+                    except BaseException:
+                        self._journal_lock.release()
+                        raise
+                try:
+                    self.write_snapshot(data)
+                    # The full snapshot supersedes any journal records
+                    self._close_journal()
+                    for path in (self.journal_filename, self.journal_filename + ".old"):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    self.journal_records = 0
+                    if self.shared:
+                        # Before the journal lock is released, so no reload check
+                        # mistakes this write for another process's
+                        del self.unsaved_records[:saved_records]
+                        self.mark_synced()
+                finally:
+                    self._journal_lock.release()
+            return True
+        except TypeError as e:
+             logger.error("Error serializing event data to JSON: %s", e)
+        except Exception as e:
+            logger.error("Error saving events to %s: %s", self.filename, e)
+        finally:
+            if reloaded:
+                self.notify("reloaded", [])
+        return False
+
+    def request_save(self):
+        """Mark the calendar dirty and let the save worker write it after the debounce delay"""
+        with self._save_condition:
+            now = time.monotonic()
+            if not self.dirty:
+                self._dirty_since = now
+            self.dirty = True
+            # Each change pushes the save back, but never past max_save_delay
+            self._save_due = min(now + self.save_delay, self._dirty_since + self.max_save_delay)
+            if self._save_thread is None or not self._save_thread.is_alive():
+                if self._save_thread is None:
+                    atexit.register(self.flush)
+                self._stopping = False
+                self._save_thread = threading.Thread(target=self._save_worker, name="calendar-save", daemon=True)
+                self._save_thread.start()
+            self._save_condition.notify_all()
+
+    def _save_worker(self):
+        """Write the snapshot whenever the calendar is dirty and its debounce delay has passed"""
+        while True:
+            with self._save_condition:
+                # Sleep until dirty and due; when stopping, save right away
+                while not self._stopping and (not self.dirty or time.monotonic() < self._save_due):
+                    self._save_condition.wait(self._save_due - time.monotonic() if self.dirty else None)
+                if not self.dirty:
+                    return  # Stopping with nothing pending
+                # Clear the flag before saving: changes made meanwhile set it again
+                self.dirty = False
+                self._saving = True
+            saved = self.save_events()
+            with self._save_condition:
+                self._saving = False
+                if not saved:
+                    # Keep the changes pending and retry; the last good snapshot stays on disk
+                    if not self.dirty:
+                        self._dirty_since = time.monotonic()
+                    self.dirty = True
+                    self._save_due = time.monotonic() + self.max_save_delay
+                self._save_condition.notify_all()
+                if self._stopping and not saved:
+                    return  # flush() reports the failure
+
+    def flush(self):
+        """Write any pending background save now, returning whether everything is on disk"""
+        with self._save_condition:
+            # Let a save that is already running finish first
+            while self._saving:
+                self._save_condition.wait()
+            pending = self.dirty
+            self.dirty = False
+        if not pending:
+            return True
+        if self.save_events():
+            return True
+        with self._save_condition:
+            self.dirty = True
+        return False
+
+    def record_change(self, op, event=None, event_id=None, events=None, event_ids=None):
+        """Persist a mutation, either as a journal record or a full save
+
+        Bulk operations pass `events` or `event_ids` and are journaled as one record.
+        """
+        if not self.journaled:
+            if self.shared:
+                # Kept until saved, to re-apply on top of other processes' writes
+                self.unsaved_records.append(self.make_record(op, event, event_id, events, event_ids))
+            if self.background_save:
+                self.request_save()
+            else:
+                self.save_events()
+            return
+        record = self.make_record(op, event, event_id, events, event_ids)
+        try:
+            self.append_journal(record)
+        except Exception as e:
+            logger.error("Error appending to journal %s: %s", self.journal_filename, e)
+
+    @staticmethod
+    def make_record(op, event=None, event_id=None, events=None, event_ids=None):
+        """Build the journal record describing a mutation"""
+        record = {"op": op}
+        if op == "delete":
+            if event_ids is not None:
+                record["ids"] = list(event_ids)
+            else:
+                record["id"] = event_id
+        elif events is not None:
+            record["events"] = [e.to_dict() for e in events]
+        else:
+            record["event"] = event.to_dict()
+        return record
+
+    def append_journal(self, record):
+        """Append one compact record to the journal and compact when it grows too long"""
+        with self.file_lock(), self._journal_lock:
+            self.journal_seq += 1
+            record["seq"] = self.journal_seq
+            if self._journal_file is None:
+                self._journal_file = open(self.journal_filename, 'a')
+            line = json.dumps(record, separators=(',', ':')) + "\n"
+            self._journal_file.write(line)
+            self._journal_file.flush()
+            os.fsync(self._journal_file.fileno())
+            self.journal_records += 1
+            if self.metrics is not None:
+                self.metrics.count("journal_records")
+                self.metrics.count("journal_bytes", len(line)) # JSON output is ASCII
+            if self.shared:
+                # Another process may rotate the journal; reopen it every time
+                self.journal_offset = os.fstat(self._journal_file.fileno()).st_size
+                self._close_journal()
+                self.seen_journal = file_signature(self.journal_filename)
+            compaction_due = (self.journal_records >= self.compact_threshold
+                              and not self.compaction_running())
+        if compaction_due:
+            # A background compaction would write outside the file lock
+            self.compact_events(background=not self.shared)
+
+    def compaction_running(self):
+        """Check whether a background compaction is in progress"""
+        return self._compaction_thread is not None and self._compaction_thread.is_alive()
+
+    @measured
+    def compact_events(self, background=False):
+        """Fold the journal into a new snapshot"""
+        old_journal = self.journal_filename + ".old"
+        with self.file_lock(), self._journal_lock:
+            # Capture the state and rotate the journal so appends can continue
+            data = self.snapshot_data()
+            self._close_journal()
+            if os.path.exists(self.journal_filename):
+                if os.path.exists(old_journal):
+                    # Leftover from an interrupted compaction: keep its records
+                    with open(self.journal_filename, 'r') as src, open(old_journal, 'a') as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_filename)
+                else:
+                    os.replace(self.journal_filename, old_journal)
+            self.journal_records = 0
+
+        def run():
+            try:
+                self.write_snapshot(data)
+                # Records in the rotated journal are now covered by the snapshot
+                if os.path.exists(old_journal):
+                    os.remove(old_journal)
+                logger.info("Compacted journal into '%s' at seq %s.", self.filename, data['journal_seq'])
+            except Exception as e:
+                logger.error("Error compacting journal into %s: %s", self.filename, e)
+
+        if background:
+            self._compaction_thread = threading.Thread(target=run, name="calendar-compaction", daemon=True)
+            self._compaction_thread.start()
+        else:
+            with self.file_lock(), self._journal_lock:
+                run()
+                if self.shared:
+                    self.mark_synced()
+
+    def _close_journal(self):
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def close(self):
+        """Write pending changes, stop the save worker, wait for a running compaction and release the journal file"""
+        self.flush()
+        with self._save_condition:
+            self._stopping = True
+            self._save_condition.notify_all()
+        if self._save_thread is not None:
+            self._save_thread.join()
+            atexit.unregister(self.flush)
+            self._save_thread = None
+        if self.compaction_running():
+            self._compaction_thread.join()
+        with self._journal_lock:
+            self._close_journal()
+
+    def subscribe(self, callback):
+        """Call callback(change, events) after every mutation
+
+        change is "added", "updated" or "removed" and events lists the affected
+        events (for "removed", as they were before deletion). Returns callback
+        so it can be passed to unsubscribe() later.
+        """
+        self.listeners.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        """Stop calling a callback registered with subscribe()"""
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def notify(self, change, events):
+        """Tell every subscriber about a change; a failing subscriber does not stop the others"""
+        for callback in list(self.listeners):
+            try:
+                callback(change, events)
+            except Exception as e:
+                logger.error("Error in change listener %r: %s", callback, e)
+
+    def gauges(self):
+        """Current sizes: events, index entries, pending journal records and file bytes
+
+        A lazily built index that has not been built yet reports None.
+        """
+        keyword_index, text_index = self.keyword_index, self.text_index
+        return {
+            "events": len(self.events_by_id),
+            "time_index_entries": len(self.time_index),
+            "keyword_index_keywords": None if keyword_index.stale else len(keyword_index.postings),
+            "text_index_terms": None if text_index.stale else len(text_index.postings),
+            "journal_pending_records": self.journal_records,
+            "snapshot_file_bytes": os.path.getsize(self.filename) if os.path.exists(self.filename) else 0,
+            "journal_file_bytes": (os.path.getsize(self.journal_filename)
+                                   if os.path.exists(self.journal_filename) else 0),
+        }
+
+    def stats(self):
+        """Return the calendar's metrics: {"operations", "counters", "gauges"}
+
+        operations maps each measured method to its call and error counts and
+        latency (total, mean, p50/p90/p99 estimated from a histogram, max);
+        counters hold snapshot/journal writes and bytes. Without
+        instrumented=True only the gauges are filled in.
+        """
+        data = self.metrics.snapshot() if self.metrics is not None else {"operations": {}, "counters": {}}
+        data["gauges"] = self.gauges()
+        return data
+
+    def prometheus_metrics(self, filename=None, prefix="calendar"):
+        """Return stats() in the Prometheus text format, optionally also writing it to a file
+
+        The file is replaced atomically, so it can be served by node_exporter's
+        textfile collector.
+        """
+        metrics = self.metrics if self.metrics is not None else Metrics()
+        text = metrics.prometheus(self.gauges(), prefix)
+        if filename is not None:
+            temp_filename = filename + ".tmp"
+            with open(temp_filename, 'w') as file:
+                file.write(text)
+            os.replace(temp_filename, filename)
+        return text
+
+    @measured
+    @synchronized
+    @log_action
+    @validate_date_format
+    def add_event(self, title, start_time, end_time=None, location="", description="", keywords=None,
+                  recurrence=None):
+        """Add a new event to the calendar
+
+        recurrence makes it a recurring event: a Recurrence, its to_dict()
+        form or an RRULE string.
+        """
+        # Basic validation already done in Event.__init__ and decorator
+        event = Event(title, start_time, end_time, location, description, keywords, recurrence)
+        # Ensure end time is not earlier than start time if both provided
+        if event.end_minutes is not None and event.end_minutes < event.start_minutes:
+            raise ValueError("Date validation error: End time cannot be earlier than start time")
+
+        event.id = self.allocate_ids(1)
+        event = self.adopt(event)
+        # Keep events ordered by start time
+        self.insert_ordered(event)
+        self.index_event(event)
+        self.record_change("add", event)
+        self.notify("added", [event])
+        return event
+
+    @measured
+    @synchronized
+    @log_action
+    def delete_event(self, event_id, expected_version=None):
+        """Delete an event by ID
+
+        With expected_version, raise EditConflictError if the event was edited
+        since the caller read that version.
+        """
+        event = self.get_event(event_id)
+        if event is not None:
+            self.check_version(event, expected_version)
+            self.remove_from_list(event)
+            self.unindex_event(event_id)
+            self.record_change("delete", event_id=event_id)
+            self.notify("removed", [event])
+            logger.info("Event with ID %s deleted.", event_id)
+            return True
+        else:
+            logger.warning("Event with ID %s not found for deletion.", event_id)
+            return False
+
+    @measured
+    @synchronized
+    def add_events_bulk(self, rows):
+        """Add many events at once, persisting them in a single save or journal record
+
+        rows is an iterable of dicts with the same keys as Event.to_dict (id is
+        ignored). Invalid rows are skipped instead of aborting the batch.
+        Returns (added events, [(row index, error message), ...]).
+        """
+        valid = []
+        errors = []
+        for row_index, row in enumerate(rows):
+            try:
+                end_time = row.get("end_time") or None
+                # Event parses each timestamp exactly once
+                event = Event(row.get("title"), row.get("start_time"), end_time, row.get("location", ""),
+                              row.get("description", ""), list(row.get("keywords") or []),
+                              row.get("recurrence"))
+                if event.start_minutes is None or (end_time and event.end_minutes is None):
+                    raise ValueError("Invalid date format. Use YYYY-MM-DD HH:MM")
+                if event.end_minutes is not None and event.end_minutes < event.start_minutes:
+                    raise ValueError("End time cannot be earlier than start time")
+                valid.append(event)
+            except ValueError as e:
+                errors.append((row_index, str(e)))
+            except (AttributeError, TypeError) as e:
+                errors.append((row_index, f"Invalid event data: {e}"))
+
+        # Assign the whole block of ids at once
+        first_id = self.allocate_ids(len(valid))
+        for offset, event in enumerate(valid):
+            event.id = first_id + offset
+        valid = [self.adopt(event) for event in valid]
+
+        if valid:
+            self.index_events(valid)
+            self.record_change("add", events=valid)
+            self.notify("added", valid)
+        logger.info("Bulk add: %s event(s) added, %s row(s) rejected.", len(valid), len(errors))
+        return valid, errors
+
+    @measured
+    @synchronized
+    def delete_events_bulk(self, event_ids):
+        """Delete many events at once, persisting the deletion in a single save or journal record
+
+        Returns (deleted ids, [(event id, error message), ...]). An id given
+        more than once is deleted once and its repeats reported as "Duplicate id".
+        """
+        deleted = {}  # Ordered set of ids to delete
+        errors = []
+        for event_id in event_ids:
+            if event_id in deleted:
+                errors.append((event_id, "Duplicate id"))
+            elif self.get_event(event_id) is not None:
+                deleted[event_id] = True
+            else:
+                errors.append((event_id, "Event not found"))
+        deleted = list(deleted)
+
+        if deleted:
+            # Only look the events up again when someone is listening
+            removed = [self.get_event(event_id) for event_id in deleted] if self.listeners else []
+            self.unindex_events(deleted)
+            self.record_change("delete", event_ids=deleted)
+            self.notify("removed", removed)
+        logger.info("Bulk delete: %s event(s) deleted, %s id(s) rejected.", len(deleted), len(errors))
+        return deleted, errors
+
+    @measured
+    @synchronized
+    @log_action
+    def skip_occurrence(self, event_id, occurrence_start, expected_version=None):
+        """Cancel one occurrence of a recurring event by adding it to the rule's exceptions
+
+        occurrence_start is the occurrence's 'YYYY-MM-DD HH:MM' start time.
+        Returns the updated event, or None if there is no such recurring event.
+        """
+        event = self.get_event(event_id)
+        if event is None or event.recurrence is None:
+            logger.warning("Event with ID %s is not a recurring event.", event_id)
+            return None
+        self.check_version(event, expected_version)
+        event.recurrence = event.recurrence.with_exception(occurrence_start)
+        event.version += 1
+        self.index_event(event)
+        self.record_change("edit", event)
+        self.notify("updated", [event])
+        return event
+
+    def allocate_ids(self, count):
+        """Reserve count consecutive event ids and return the first; callers hold the write lock
+
+        In shared mode the reservation is recorded in <filename>.ids under the
+        file lock, so no other process hands out the same ids and an id
+        returned to a caller stays that event's id even before it is saved.
+        """
+        first_id = self.next_id
+        if self.shared:
+            with self.file_lock():
+                first_id = max(first_id, self.read_reserved_id())
+                # Atomic, so a torn write never lowers the reservation
+                temp_filename = self.ids_filename + ".tmp"
+                with open(temp_filename, 'w') as file:
+                    file.write(str(first_id + count))
+                os.replace(temp_filename, self.ids_filename)
+        self.next_id = first_id + count
+        return first_id
+
+    def read_reserved_id(self):
+        """Return the next id no process has reserved yet, per <filename>.ids (1 if there is none)"""
+        try:
+            with open(self.ids_filename, 'r') as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return 1
+
+    @staticmethod
+    def check_version(event, expected_version):
+        """Raise EditConflictError unless the event is at expected_version (None skips the check)"""
+        if expected_version is not None and event.version != expected_version:
+            raise EditConflictError(f"Event {event.id} was changed by someone else "
+                                    f"(version {event.version}, expected {expected_version}).")
+
+    def insert_ordered(self, event):
+        """Insert an event into the start-ordered list after any equal start times"""
+        if self.ordering_deferred:
+            self.events.append(event)
+        else:
+            bisect.insort(self.events, event, key=start_order)
+
+    @contextmanager
+    def deferred_ordering(self):
+        """Skip ordering work for mutations inside the block and sort once on exit"""
+        self.ordering_deferred += 1
+        try:
+            yield self
+        finally:
+            self.ordering_deferred -= 1
+            if not self.ordering_deferred:
+                self.events.sort(key=start_order)
+
+    def remove_from_list(self, event):
+        """Remove an event from the start-ordered list in place, without copying it"""
+        if self.ordering_deferred:
+            # The list is unordered until the deferred block ends
+            self.events.remove(event)
+            return
+        key = start_order(event)
+        i = bisect.bisect_left(self.events, key, key=start_order)
+        # Walk the events sharing the same start time to find this one
+        while i < len(self.events) and start_order(self.events[i]) == key:
+            if self.events[i] is event:
+                del self.events[i]
+                return
+            i += 1
+        # The list was reordered behind our back; fall back to a linear search
+        self.events.remove(event)
+
+    @measured
+    @synchronized
+    @log_action
+    @validate_date_format
+    def edit_event(self, event_id, title, start_time, end_time=None, location="", description="", keywords=None,
+                   recurrence=None, expected_version=None):
+        """Edit an existing event
+
+        Like every other field, recurrence is replaced (None makes the event a
+        one-off). With expected_version, raise EditConflictError if the event
+        was edited or deleted since the caller read that version.
+        """
+        recurrence = Recurrence.coerce(recurrence)
+        # Ensure end time is not earlier than start time if both provided
+        if end_time:
+             try:
+                 if parse_minutes(end_time) < parse_minutes(start_time):
+                     raise ValueError("End time cannot be earlier than start time")
+             except ValueError as e: # Catch parsing error or comparison error
+                 raise ValueError(f"Date validation error: {e}")
+
+        event = self.get_event(event_id)
+        if event is None and expected_version is not None:
+            raise EditConflictError(f"Event {event_id} was deleted by someone else.")
+        if event is not None:
+            self.check_version(event, expected_version)
+            # Only an event whose start time changes needs repositioning
+            reposition = event.start_time != start_time
+            if reposition:
+                self.remove_from_list(event)
+            event.title = title
+            event.start_time = start_time
+            event.end_time = end_time
+            event.location = location
+            event.description = description
+            event.keywords = keywords if keywords else []
+            event.recurrence = recurrence
+            event.version += 1
+            if reposition:
+                self.insert_ordered(event)
+            self.index_event(event)
+            self.record_change("edit", event)
+            self.notify("updated", [event])
+            logger.info("Event with ID %s updated.", event_id)
+            return event
+        logger.warning("Event with ID %s not found for editing.", event_id)
+        return None
+
+    @measured
+    @synchronized_read
+    def get_event(self, event_id):
+        """Get an event by ID"""
+        return self.events_by_id.get(event_id)
+
+    @synchronized_read
+    def get_all_events(self):
+        """Get all events ordered by start time"""
+        # Other threads may change the live list once the lock is released
+        return list(self.events) if self.thread_safe else self.events
+
+    def get_upcoming_events(self):
+        """Get all upcoming events (start or end time is in the future)
+
+        Events whose start time does not parse cannot be placed in time;
+        they are listed after the others rather than dropped.
+        """
+        # An event is upcoming if it starts now or later, or if it is still
+        # ongoing (started in the past but its end time is now or later)
+        return self.get_events_between(datetime.now(), None) + self.undated_events()
+
+    @synchronized_read
+    def undated_events(self):
+        """Get the events whose start time does not parse, which no time range contains"""
+        # start_order keeps them at the end of the list
+        return self.events[bisect.bisect_left(self.events, (True, 0), key=start_order):]
+
+    def query_range(self, start, end):
+        """Validate a get_events_between range and return it in minutes (end may be inf)"""
+        try:
+            start_minutes = to_minutes(start)
+            end_minutes = to_minutes(end) if end is not None else float("inf")
+        except ValueError:
+            raise ValueError("Invalid date format. Use YYYY-MM-DD HH:MM")
+        if end_minutes < start_minutes:
+            raise ValueError("End of range cannot be earlier than its start")
+        return start_minutes, end_minutes
+
+    @measured
+    @synchronized_read
+    def get_events_between(self, start, end=None):
+        """Get events overlapping the range [start, end], ordered by start time
+
+        start and end may be datetimes or 'YYYY-MM-DD HH:MM' strings; end=None
+        leaves the range open-ended. Recurring events are listed as one
+        Occurrence per occurrence in the range; in an open-ended range only
+        those starting within RECURRENCE_HORIZON minutes (a year) are listed.
+        Use iter_events_between to walk further lazily.
+        """
+        start_minutes, end_minutes = self.query_range(start, end)
+        events = self.events_overlapping(start_minutes, end_minutes)
+        if not any(event.recurrence is not None for event in events):
+            return events
+        horizon = min(end_minutes, start_minutes + self.RECURRENCE_HORIZON)
+        expanded = []
+        for event in events:
+            if event.recurrence is None:
+                expanded.append(event)
+            else:
+                expanded.extend(event.occurrences(start_minutes, horizon))
+        # Stable, so one-off events keep their index order among equal starts
+        expanded.sort(key=lambda x: x.start_minutes)
+        return expanded
+
+    def iter_events_between(self, start, end=None):
+        """Yield events overlapping [start, end] in start order, expanding recurring events lazily
+
+        Unlike get_events_between there is no horizon: a never-ending series
+        in an open-ended range yields occurrences for as long as the caller
+        keeps iterating.
+        """
+        start_minutes, end_minutes = self.query_range(start, end)
+        events = self.events_overlapping(start_minutes, end_minutes)
+        one_offs = [event for event in events if event.recurrence is None]
+        series = [event.occurrences(start_minutes, end_minutes) for event in events if event.recurrence is not None]
+        yield from heapq.merge(one_offs, *series, key=lambda x: x.start_minutes)
+
+    @synchronized_read
+    def events_overlapping(self, start_minutes, end_minutes):
+        """Return stored events overlapping [start_minutes, end_minutes], ordered by start
+
+        A recurring event is returned once, as its series, if the span of
+        the whole series overlaps; get_events_between expands it.
+        """
+        return self.time_index.overlapping(start_minutes, end_minutes)
+
+    def built_index(self, attribute):
+        """Return the lazily built keyword_index or text_index, building it first if stale
+
+        A fresh index is built aside and swapped in, so concurrent readers
+        never see a half-built one.
+        """
+        index = getattr(self, attribute)
+        if index.stale:
+            with self._index_lock:
+                index = getattr(self, attribute)
+                if index.stale:
+                    index = type(index)()
+                    index.build(self.events)
+                    setattr(self, attribute, index)
+        return index
+
+    @measured
+    @synchronized_read
+    def get_events_by_keyword(self, keyword, match="substring"):
+        """Get events by keyword (case-insensitive)
+
+        match selects how the keyword is compared: "substring" (default),
+        "prefix" or "exact".
+        """
+        if not keyword: # Return empty list if keyword is empty
+            return []
+        index = self.built_index("keyword_index")
+        events = [self.events_by_id[event_id] for event_id in index.search(keyword, match)]
+        events.sort(key=lambda x: (start_order(x), x.id))
+        return events
+
+    @measured
+    @synchronized_read
+    def search(self, query, limit=50):
+        """Full-text search over title, location and description, best match first
+
+        Terms are AND-ed by default; use OR between alternatives and double
+        quotes for phrases, e.g. 'standup OR "team sync" berlin'.
+        """
+        if not query or not query.strip():
+            return []
+        index = self.built_index("text_index")
+        return [self.events_by_id[event_id] for event_id, _ in index.search(query, limit)]
+
+class SqliteCalendar(Calendar):
+    """Calendar stored in an SQLite database
+
+    Events are not kept in memory: id lookups, time-range queries, keyword
+    and full-text searches run as indexed SQL queries. Time ranges use the
+    same duration-class scheme as IntervalIndex on a (duration_class,
+    start_minutes) index, keywords have a B-tree index (exact/prefix) plus an
+    FTS5 trigram index (substring), and text search uses FTS5 with BM25
+    ranking. The database runs in WAL mode so readers never block the writer.
+
+    A new database is filled once from the JSON calendar file, if one exists.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT,
+            location TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL DEFAULT '',
+            start_minutes INTEGER,  -- NULL if start_time does not parse
+            end_key INTEGER,        -- effective end minute (of the whole series if recurring)
+            duration_class INTEGER, -- bit length of end_key - start_minutes
+            version INTEGER NOT NULL DEFAULT 1,
+            recurrence TEXT         -- Recurrence.to_dict() as JSON, NULL for one-off events
+        );
+        CREATE INDEX IF NOT EXISTS events_by_class_start ON events (duration_class, start_minutes);
+        CREATE INDEX IF NOT EXISTS events_by_start ON events (start_minutes, id);
+        CREATE TABLE IF NOT EXISTS keywords (
+            event_id INTEGER NOT NULL,
+            keyword TEXT NOT NULL,
+            keyword_norm TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS keywords_by_keyword ON keywords (keyword_norm);
+        CREATE INDEX IF NOT EXISTS keywords_by_event ON keywords (event_id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+            title, location, description, content='events', content_rowid='id');
+        CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+            INSERT INTO events_fts (rowid, title, location, description)
+            VALUES (new.id, new.title, new.location, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+            INSERT INTO events_fts (events_fts, rowid, title, location, description)
+            VALUES ('delete', old.id, old.title, old.location, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE ON events BEGIN
+            INSERT INTO events_fts (events_fts, rowid, title, location, description)
+            VALUES ('delete', old.id, old.title, old.location, old.description);
+            INSERT INTO events_fts (rowid, title, location, description)
+            VALUES (new.id, new.title, new.location, new.description);
+        END;
+    """
+
+    # Needs SQLite 3.34+; without it substring keyword search falls back to a scan
+    TRIGRAM_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS keywords_fts USING fts5(
+            keyword_norm, content='keywords', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS keywords_fts_insert AFTER INSERT ON keywords BEGIN
+            INSERT INTO keywords_fts (rowid, keyword_norm) VALUES (new.rowid, new.keyword_norm);
+        END;
+        CREATE TRIGGER IF NOT EXISTS keywords_fts_delete AFTER DELETE ON keywords BEGIN
+            INSERT INTO keywords_fts (keywords_fts, rowid, keyword_norm) VALUES ('delete', old.rowid, old.keyword_norm);
+        END;
+    """
+
+    EVENT_COLUMNS = "id, title, start_time, end_time, location, description, version, recurrence"
+    MAX_DURATION_CLASS = 40
+    OPEN_END = 1 << 62  # Stands in for an open-ended range in SQL
+
+    def __init__(self, filename="calendar_events.db", json_filename="calendar_events.json", autoload=True,
+                 instrumented=False):
+        super().__init__(filename, autoload=False, instrumented=instrumented)
+        self.json_filename = json_filename
+        self.db = None
+        self.has_trigram = False
+        if autoload:
+            self.load_events()
+
+    def load_events_progressively(self, batch_size=1000):
+        """Open the database, creating and migrating it on first use
+
+        Nothing is loaded into memory, so this generator yields no batches.
+        """
+        self.loaded = False
+        self.close()
+        self.db = sqlite3.connect(self.filename, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.executescript(self.SCHEMA)
+            # Databases created before events had versions or recurrence rules
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(events)")]
+            if "version" not in columns:
+                self.db.execute("ALTER TABLE events ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            if "recurrence" not in columns:
+                self.db.execute("ALTER TABLE events ADD COLUMN recurrence TEXT")
+            # Events used to be ordered by their start time text
+            self.db.execute("DROP INDEX IF EXISTS events_by_start_time")
+            try:
+                self.db.executescript(self.TRIGRAM_SCHEMA)
+                self.has_trigram = True
+            except sqlite3.OperationalError:
+                logger.warning("SQLite has no FTS5 trigram tokenizer; keyword substring search will scan.")
+        if self.get_meta("migrated") is None:
+            self.migrate_from_json()
+        max_id = self.db.execute("SELECT MAX(id) FROM events").fetchone()[0] or 0
+        self.next_id = max(self.get_meta("next_id") or 1, max_id + 1)
+        self.loaded = True
+        yield from ()
+
+    def migrate_from_json(self):
+        """Copy events from the JSON calendar file (snapshot and journal) into the database, once"""
+        count = 0
+        # A journaled calendar may not have written its first snapshot yet
+        if os.path.exists(self.json_filename) or os.path.exists(self.json_filename + ".journal"):
+            source = Calendar(self.json_filename)
+            with self.db:
+                self.insert_events(source.events)
+                self.set_meta("next_id", source.next_id)
+            count = len(source.events)
+            logger.info("Migrated %s event(s) from '%s' to '%s'.", count, self.json_filename, self.filename)
+        with self.db:
+            self.set_meta("migrated", self.json_filename if count else "")
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        """Close the database connection"""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    @measured
+    def save_events(self):
+        """Every change is committed as it happens; nothing to do"""
+        return True
+
+    def gauges(self):
+        """Row counts of the events and keywords tables, and the database file size"""
+        count = lambda table: self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return {
+            "events": count("events"),
+            "keyword_rows": count("keywords"),
+            "database_file_bytes": os.path.getsize(self.filename) if os.path.exists(self.filename) else 0,
+        }
+
+    # Events live only in the database: the in-memory bookkeeping is skipped
+    def index_event(self, event):
+        pass
+
+    def unindex_event(self, event_id):
+        pass
+
+    def index_events(self, events):
+        pass
+
+    def unindex_events(self, event_ids):
+        pass
+
+    def insert_ordered(self, event):
+        pass
+
+    def remove_from_list(self, event):
+        pass
+
+    def record_change(self, op, event=None, event_id=None, events=None, event_ids=None):
+        """Write a mutation to the database in one transaction"""
+        with self.db:
+            if op == "delete":
+                ids = [(i,) for i in (event_ids if event_ids is not None else [event_id])]
+                self.db.executemany("DELETE FROM keywords WHERE event_id = ?", ids)
+                self.db.executemany("DELETE FROM events WHERE id = ?", ids)
+            elif op == "edit":
+                self.db.execute("DELETE FROM keywords WHERE event_id = ?", (event.id,))
+                self.db.execute(
+                    "UPDATE events SET title = ?, start_time = ?, end_time = ?, location = ?, description = ?,"
+                    " start_minutes = ?, end_key = ?, duration_class = ?, version = ?, recurrence = ? WHERE id = ?",
+                    self.event_row(event)[1:] + (event.id,))
+                self.insert_keywords([event])
+            else:
+                self.insert_events(events if events is not None else [event])
+                self.set_meta("next_id", self.next_id)
+
+    @staticmethod
+    def event_row(event):
+        """Return the events table row for an event"""
+        start = event.start_minutes
+        end_key = duration_class = None
+        if start is not None:
+            end_key = event.span_end_minutes()
+            duration_class = (end_key - start).bit_length()
+        recurrence = None if event.recurrence is None else json.dumps(event.recurrence.to_dict())
+        return (event.id, event.title, event.start_time, event.end_time, event.location or "",
+                event.description or "", start, end_key, duration_class, event.version, recurrence)
+
+    def insert_events(self, events):
+        self.db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (self.event_row(event) for event in events))
+        self.insert_keywords(events)
+
+    def insert_keywords(self, events):
+        self.db.executemany("INSERT INTO keywords (event_id, keyword, keyword_norm) VALUES (?, ?, ?)",
+                            ((event.id, kw, KeywordIndex.normalize(kw)) for event in events for kw in event.keywords))
+
+    def query_events(self, sql, params=()):
+        """Run a query selecting EVENT_COLUMNS and build Events, keeping the row order"""
+        events = []
+        for event_id, title, start_time, end_time, location, description, version, recurrence \
+                in self.db.execute(sql, params):
+            if recurrence is not None:
+                recurrence = Recurrence.from_dict(json.loads(recurrence))
+            event = Event(title, start_time, end_time, location, description, recurrence=recurrence)
+            event.id = event_id
+            event.version = version
+            events.append(event)
+        # Attach keywords, fetched in chunks to stay below SQLite's parameter limit
+        by_id = {event.id: event for event in events}
+        ids = list(by_id)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT event_id, keyword FROM keywords WHERE event_id IN ({','.join('?' * len(chunk))})"
+                " ORDER BY rowid", chunk)
+            for event_id, keyword in rows:
+                by_id[event_id].keywords.append(intern_string(keyword))
+        return events
+
+    @measured
+    @synchronized_read
+    def get_event(self, event_id):
+        """Get an event by ID"""
+        events = self.query_events(f"SELECT {self.EVENT_COLUMNS} FROM events WHERE id = ?", (event_id,))
+        return events[0] if events else None
+
+    @synchronized_read
+    def get_all_events(self):
+        """Get all events ordered by start time, those whose start time does not parse last"""
+        # Two queries, so the dated ones come straight off the events_by_start index
+        return (self.query_events(f"SELECT {self.EVENT_COLUMNS} FROM events WHERE start_minutes IS NOT NULL"
+                                  " ORDER BY start_minutes, id")
+                + self.undated_events())
+
+    @synchronized_read
+    def undated_events(self):
+        """Get the events whose start time does not parse"""
+        return self.query_events(f"SELECT {self.EVENT_COLUMNS} FROM events WHERE start_minutes IS NULL ORDER BY id")
+
+    @synchronized_read
+    def events_overlapping(self, start_minutes, end_minutes):
+        """Return events overlapping [start_minutes, end_minutes], ordered by start"""
+        end_minutes = min(end_minutes, self.OPEN_END)
+        # One index range per duration class, as in IntervalIndex.overlapping
+        return self.query_events(f"""
+            WITH RECURSIVE classes (c) AS (SELECT 0 UNION ALL SELECT c + 1 FROM classes WHERE c < ?)
+            SELECT {', '.join('e.' + column for column in self.EVENT_COLUMNS.split(', '))}
+            FROM classes JOIN events e ON e.duration_class = classes.c
+                AND e.start_minutes BETWEEN ? - ((1 << classes.c) - 1) AND ?
+            WHERE e.end_key >= ?
+            ORDER BY e.start_minutes, e.end_key, e.id""",
+            (self.MAX_DURATION_CLASS, start_minutes, end_minutes, start_minutes))
+
+    @measured
+    @synchronized_read
+    def get_events_by_keyword(self, keyword, match="substring"):
+        """Get events by keyword (case-insensitive)
+
+        match selects how the keyword is compared: "substring" (default),
+        "prefix" or "exact".
+        """
+        if not keyword: # Return empty list if keyword is empty
+            return []
+        query = KeywordIndex.normalize(keyword)
+        if match == "exact":
+            ids_sql, params = "SELECT event_id FROM keywords WHERE keyword_norm = ?", (query,)
+        elif match == "prefix":
+            ids_sql = "SELECT event_id FROM keywords WHERE keyword_norm >= ? AND keyword_norm < ?"
+            params = (query, query + "\U0010ffff")
+        elif match != "substring":
+            raise ValueError(f"Unknown keyword match mode: {match}")
+        elif self.has_trigram and len(query) >= 3:
+            ids_sql = ("SELECT k.event_id FROM keywords_fts f JOIN keywords k ON k.rowid = f.rowid"
+                       " WHERE keywords_fts MATCH ?")
+            params = ('"' + query.replace('"', '""') + '"',)
+        else:
+            ids_sql, params = "SELECT event_id FROM keywords WHERE instr(keyword_norm, ?) > 0", (query,)
+        return self.query_events(
+            f"SELECT {self.EVENT_COLUMNS} FROM events WHERE id IN ({ids_sql})"
+            " ORDER BY start_minutes IS NULL, start_minutes, id", params)
+
+    @measured
+    @synchronized_read
+    def search(self, query, limit=50):
+        """Full-text search over title, location and description, best match first
+
+        Takes the same query syntax as Calendar.search.
+        """
+        groups = TextIndex.parse_query(query) if query else []
+        if not groups:
+            return []
+        # Every clause becomes an FTS5 phrase; tokens are \w+ so need no escaping
+        fts_query = " OR ".join(
+            "(" + " AND ".join('"' + " ".join(terms) + '"' for terms in group) + ")" for group in groups)
+        return self.query_events(
+            f"SELECT {', '.join('e.' + column for column in self.EVENT_COLUMNS.split(', '))}"
+            " FROM events_fts JOIN events e ON e.id = events_fts.rowid"
+            " WHERE events_fts MATCH ? ORDER BY bm25(events_fts), e.id LIMIT ?",
+            (fts_query, -1 if limit is None else limit))
+
+class MappedEvents:
+    """Lazy, read-only sequence of a MappedCalendar's events in start time order
+
+    Indexing decodes (and caches) just the events asked for, so a view that
+    only shows one screen of events never decodes the rest.
+    """
+
+    def __init__(self, calendar):
+        self.calendar = calendar
+
+    def __len__(self):
+        return self.calendar.snapshot.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.calendar.event_at(number) for number in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        return self.calendar.event_at(index)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self.calendar.event_at(number)
+
+class MappedCalendar(Calendar):
+    """Read-only calendar over a memory-mapped binary snapshot, for large archives
+
+    Opening maps the file and reads only its header, string table and index
+    positions, so it is near-instant whatever the file size. get_event and
+    range queries bisect the id and time indexes in the mapped file and
+    decode only the events they return; get_all_events returns a lazy
+    MappedEvents sequence. Decoded events are cached, so touching an event
+    again returns the same object. Keyword and full-text searches need every
+    event, so the first one decodes them all and builds the usual indexes.
+
+    The file must be a version 2 binary snapshot (written by a calendar with
+    snapshot_format="binary", or by convert_snapshot) without pending
+    journal records. Every mutation raises ReadOnlyCalendarError.
+    """
+
+    read_only = True
+
+    def __init__(self, filename="calendar_events.json", autoload=True, instrumented=False):
+        super().__init__(filename, autoload=False, backup_count=0, instrumented=instrumented)
+        self.snapshot = None
+        self.materialized = {}  # record number -> decoded Event
+        if autoload:
+            self.load_events()
+
+    def load_events_progressively(self, batch_size=1000):
+        """Map the snapshot; nothing is decoded, so this generator yields no batches"""
+        self.loaded = False
+        self.close()
+        if os.path.exists(self.journal_filename) and os.path.getsize(self.journal_filename):
+            raise ValueError(f"'{self.journal_filename}' has changes the snapshot lacks; compact it first")
+        self.snapshot = MappedSnapshot(self.filename)
+        self.materialized = {}
+        self.events = []  # Filled by materialize_all() when a search needs it
+        self.events_by_id = {}
+        self.next_id = self.snapshot.next_id
+        self.journal_seq = self.snapshot.journal_seq
+        self.loaded = True
+        yield from ()
+
+    def event_at(self, number):
+        """Return the event stored as record `number`, decoding it on first use"""
+        event = self.materialized.get(number)
+        if event is None:
+            event = self.materialized.setdefault(number, self.snapshot.record(number))
+        return event
+
+    def materialize_all(self):
+        """Decode every event into self.events and self.events_by_id, for the in-memory indexes"""
+        with self._index_lock:
+            if len(self.events) != self.snapshot.count:
+                events = [self.event_at(number) for number in range(self.snapshot.count)]
+                self.events_by_id = {event.id: event for event in events}
+                self.events = events
+
+    def close(self):
+        """Unmap the snapshot"""
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def save_events(self):
+        """Nothing ever changes; nothing to do"""
+        return True
+
+    def reload_progressively(self, batch_size=1000):
+        """The archive is not watched for changes; call load_events() to re-map it"""
+        return False
+        yield
+
+    def gauges(self):
+        return {
+            "events": self.snapshot.count if self.snapshot is not None else 0,
+            "decoded_events": len(self.materialized),
+            "snapshot_file_bytes": os.path.getsize(self.filename) if os.path.exists(self.filename) else 0,
+        }
+
+    @measured
+    def get_event(self, event_id):
+        """Get an event by its ID"""
+        number = self.snapshot.find(event_id)
+        return None if number is None else self.event_at(number)
+
+    def get_all_events(self):
+        """Get all events, sorted by start time, as a lazily decoded sequence"""
+        return MappedEvents(self)
+
+    def undated_events(self):
+        """Get the events whose start time does not parse, decoding only those and a few to find them"""
+        events = MappedEvents(self)
+        return events[bisect.bisect_left(events, (True, 0), key=start_order):]
+
+    def events_overlapping(self, start_minutes, end_minutes):
+        """Return stored events overlapping [start_minutes, end_minutes], ordered by start"""
+        return [self.event_at(number) for number in self.snapshot.overlapping(start_minutes, end_minutes)]
+
+    def get_events_by_keyword(self, keyword, match="substring"):
+        if keyword:
+            self.materialize_all()
+        return super().get_events_by_keyword(keyword, match)
+
+    def search(self, query, limit=50):
+        if query and query.strip():
+            self.materialize_all()
+        return super().search(query, limit)
+
+def month_key(minutes):
+    """Return the 'YYYY-MM' partition key of a minute timestamp"""
+    day = date.fromordinal(EPOCH_ORDINAL + minutes // 1440)
+    return f"{day.year:04d}-{day.month:02d}"
+
+class PartitionedCalendar(Calendar):
+    """Calendar stored as one segment file per month plus a manifest, loaded partition by partition
+
+    Events are partitioned by the month they (or their series) start in;
+    events whose start time does not parse go to the "undated" partition.
+    <directory>/manifest.json lists every partition with its segment file,
+    event count, first start minute and last span end minute (Recurrence.
+    OPEN_END for a never-ending series). Segments are ordinary snapshots in
+    the calendar's snapshot_format, optionally gzip-compressed.
+
+    Opening reads only the manifest. Range queries, and so
+    get_upcoming_events, load just the partitions whose span overlaps the
+    range; months whose events have all ended stay on disk. get_event loads
+    the rest only when the id is not found in what is loaded already;
+    get_all_events and the keyword and full-text searches load everything.
+    A mutation loads the partitions it touches, marks them dirty, and
+    save_events rewrites only the dirty segments and then the manifest.
+
+    Every save writes segments under new file names (<key>.<generation>)
+    and commits them by replacing the manifest, so a crash leaves either the
+    old or the new set of segments in use; files the manifest no longer
+    references are removed on the next load. archive_partitions()
+    compresses old months in place without loading or rewriting anything
+    else. A new directory is filled once from the JSON calendar file, if
+    one exists. Partitioned calendars are single-process and not journaled.
+    """
+
+    MANIFEST_VERSION = 1
+    UNDATED = "undated"
+    SEGMENT_RE = re.compile(r"(?:\d{4}-\d\d|undated)\.\d+\.(?:json|bin)(?:\.gz)?(?:\.tmp)?$")
+
+    def __init__(self, directory="calendar_events", json_filename="calendar_events.json", autoload=True,
+                 background_save=False, save_delay=0.5, max_save_delay=5.0, thread_safe=False, instrumented=False,
+                 snapshot_format="json"):
+        super().__init__(os.path.join(directory, "manifest.json"), autoload=False, background_save=background_save,
+                         save_delay=save_delay, max_save_delay=max_save_delay, backup_count=0,
+                         thread_safe=thread_safe, instrumented=instrumented, snapshot_format=snapshot_format)
+        self.directory = directory
+        self.json_filename = json_filename
+        self.generation = 0           # Bumped by every save; part of new segment file names
+        self.partitions = {}          # partition key -> manifest entry, as last written
+        self.loaded_partitions = set()
+        self.partition_of = {}        # event id -> partition key, for loaded events
+        self.members = {}             # partition key -> ids of its loaded events
+        self.dirty_partitions = set()
+        if autoload:
+            self.load_events()
+
+    def load_events_progressively(self, batch_size=1000):
+        """Read the manifest, creating and migrating the directory on first use
+
+        No partition is loaded until a query needs it, so this generator
+        yields no batches.
+        """
+        self.loaded = False
+        self.events = []
+        self.rebuild_indexes()
+        self.loaded_partitions = set()
+        self.partition_of = {}
+        self.members = {}
+        self.dirty_partitions = set()
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.filename):
+            # A bad manifest is an error, never an empty calendar: saving over
+            # it would orphan every segment
+            with open(self.filename, 'r') as file:
+                manifest = json.load(file)
+            if manifest.get("version", 0) > self.MANIFEST_VERSION:
+                raise ValueError(f"Unsupported manifest version {manifest['version']} in '{self.filename}'")
+            self.partitions = manifest["partitions"]
+            self.generation = manifest.get("generation", 0)
+            self.next_id = manifest.get("next_id", 1)
+        else:
+            self.partitions = {}
+            self.generation = 0
+            self.next_id = 1
+            self.migrate_from_json()
+        self.remove_stray_segments()
+        self.loaded = True
+        yield from ()
+
+    def migrate_from_json(self):
+        """Partition the events of the JSON calendar file (snapshot and journal) into a new directory"""
+        if not (os.path.exists(self.json_filename) or os.path.exists(self.json_filename + ".journal")):
+            return
+        source = Calendar(self.json_filename)
+        self.next_id = source.next_id
+        self.index_events(source.events)
+        self.track(source.events)
+        self.loaded_partitions.update(self.members)
+        if self.save_events():
+            logger.info("Migrated %s event(s) from '%s' into %s partition(s) in '%s'.",
+                        len(source.events), self.json_filename, len(self.partitions), self.directory)
+
+    def remove_stray_segments(self):
+        """Delete segment files the manifest does not reference, left behind by an interrupted save"""
+        referenced = {entry["file"] for entry in self.partitions.values()}
+        for name in os.listdir(self.directory):
+            if self.SEGMENT_RE.match(name) and name not in referenced:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    logger.warning("Could not remove stray segment '%s': %s", name, e)
+
+    def reload_progressively(self, batch_size=1000):
+        """A partitioned calendar is used by one process only; nothing to pick up"""
+        return False
+        yield
+
+    @classmethod
+    def partition_key(cls, event):
+        """Return the key of the partition an event belongs to"""
+        start = event.start_minutes
+        return cls.UNDATED if start is None else month_key(start)
+
+    def track(self, events):
+        """Assign events to their partitions and mark those (and any partition they left) dirty"""
+        for event in events:
+            key = self.partition_key(event)
+            old_key = self.partition_of.get(event.id)
+            if old_key != key:
+                if old_key is not None:
+                    # Moved to another month by an edit
+                    self.members[old_key].discard(event.id)
+                    self.dirty_partitions.add(old_key)
+                self.partition_of[event.id] = key
+                self.members.setdefault(key, set()).add(event.id)
+            self.dirty_partitions.add(key)
+
+    def untrack(self, event_ids):
+        """Drop deleted events from their partitions, marking those dirty"""
+        for event_id in event_ids:
+            key = self.partition_of.pop(event_id, None)
+            if key is not None:
+                self.members[key].discard(event_id)
+                self.dirty_partitions.add(key)
+
+    def record_change(self, op, event=None, event_id=None, events=None, event_ids=None):
+        """Mark the partitions a mutation touched dirty, then save (or schedule a save)"""
+        if op == "delete":
+            self.untrack(event_ids if event_ids is not None else [event_id])
+        else:
+            self.track(events if events is not None else [event])
+            # A segment is rewritten whole, so its stored events must be loaded first
+            self.load_partitions(self.dirty_partitions)
+        super().record_change(op, event, event_id, events, event_ids)
+
+    def segment_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read_segment(self, name):
+        """Read the events of one segment file, gzip-compressed or not"""
+        path = self.segment_path(name)
+        opener = gzip.open if name.endswith(".gz") else open
+        meta = {}
+        if ".bin" in name:
+            with opener(path, 'rb') as file:
+                events = list(iter_binary_snapshot_events(file, meta))
+        else:
+            with opener(path, 'rt') as file:
+                events = [Event.from_dict(event_data) for event_data in iter_snapshot_events(file, meta)]
+        if not all(events):
+            logger.warning("Failed to load %s event(s) from '%s'.", events.count(None), path)
+        return [self.adopt(event) for event in events if event]
+
+    def load_partition(self, key):
+        """Load one partition's stored events into memory and the indexes; callers hold the write lock"""
+        self.loaded_partitions.add(key)
+        entry = self.partitions.get(key)
+        if entry is None:
+            return  # A partition that has not been saved yet
+        # Events already in memory (e.g. moved here by an edit) are newer than the segment
+        events = [event for event in self.read_segment(entry["file"]) if event.id not in self.partition_of]
+        for event in events:
+            self.partition_of[event.id] = key
+        self.members.setdefault(key, set()).update(event.id for event in events)
+        self.index_events(events)
+        logger.debug("Loaded partition %s: %s event(s) from '%s'.", key, len(events), entry["file"])
+
+    def load_partitions(self, keys):
+        """Load the given partitions unless they already are"""
+        missing = [key for key in keys if key not in self.loaded_partitions]
+        if not missing:
+            return
+        with self._state_lock, self.deferred_ordering():
+            for key in missing:
+                if key not in self.loaded_partitions:
+                    self.load_partition(key)
+
+    def load_all_partitions(self):
+        self.load_partitions(list(self.partitions))
+
+    def partitions_overlapping(self, start_minutes, end_minutes):
+        """Return the keys of the stored partitions holding events that overlap the range"""
+        return [key for key, entry in self.partitions.items()
+                if entry["first"] is not None and entry["first"] <= end_minutes and entry["last"] >= start_minutes]
+
+    @staticmethod
+    def partition_entry(name, events):
+        """Build the manifest entry describing a segment of events"""
+        dated = [event for event in events if event.start_minutes is not None]
+        return {
+            "file": name,
+            "events": len(events),
+            "first": min(event.start_minutes for event in dated) if dated else None,
+            "last": max(event.span_end_minutes() for event in dated) if dated else None,
+            "archived": name.endswith(".gz"),
+        }
+
+    def write_manifest(self, partitions, generation, next_id):
+        """Atomically replace the manifest; callers hold _journal_lock"""
+        manifest = {
+            "version": self.MANIFEST_VERSION,
+            "generation": generation,
+            "next_id": next_id,
+            "partitions": dict(sorted(partitions.items())),
+        }
+        temp_filename = self.write_temp_snapshot(self.filename, manifest, snapshot_format="json")
+        os.replace(temp_filename, self.filename)
+        fsync_directory(self.directory)
+
+    @measured
+    def save_events(self):
+        """Rewrite the dirty partitions' segments and the manifest, returning whether the save succeeded"""
+        extension = ".bin" if self.snapshot_format == "binary" else ".json"
+        with self._state_lock:
+            dirty = self.dirty_partitions
+            if not dirty:
+                return True
+            self.dirty_partitions = set()
+            self.generation += 1
+            generation, next_id = self.generation, self.next_id
+            partitions = dict(self.partitions)
+            segments = []
+            for key in sorted(dirty):
+                events = sorted((self.events_by_id[event_id] for event_id in self.members.get(key, ())),
+                                key=start_order)
+                if not events:
+                    partitions.pop(key, None)
+                    continue
+                # A changed archived month is hot again and is written uncompressed
+                name = f"{key}.{generation}{extension}"
+                partitions[key] = self.partition_entry(name, events)
+                segments.append((name, {"events": [event.to_dict() for event in events],
+                                        "next_id": next_id, "journal_seq": 0}))
+            # Saves and archiving must reach the disk in the order they were captured
+            self._journal_lock.acquire()
+        try:
+            for name, data in segments:
+                path = self.segment_path(name)
+                os.replace(self.write_temp_snapshot(path, data), path)
+            fsync_directory(self.directory)
+            # Replacing the manifest commits the new segments
+            self.write_manifest(partitions, generation, next_id)
+            superseded = [self.partitions[key]["file"] for key in dirty if key in self.partitions]
+            self.partitions = partitions
+            for name in superseded:
+                os.remove(self.segment_path(name))
+            return True
+        except Exception as e:
+            logger.error("Error saving partitions to %s: %s", self.directory, e)
+            # Not under the state lock: it is never taken while holding the journal lock
+            self.dirty_partitions.update(dirty)
+            return False
+        finally:
+            self._journal_lock.release()
+
+    def archive_partitions(self, before=None):
+        """gzip-compress the segments of months before `before` whose events have all ended by then
+
+        before is a datetime or 'YYYY-MM-DD HH:MM' string (default: now); the
+        month it falls in and every later one stay uncompressed, as does an
+        older month with an event still running (e.g. a never-ending series).
+        Archived segments stay listed in the manifest and load transparently,
+        just more slowly. Returns the keys of the partitions archived.
+        """
+        cutoff = to_minutes(before if before is not None else datetime.now())
+        cutoff_key = month_key(cutoff)
+        # Pending changes first, so what gets compressed is current
+        self.flush()
+        with self._state_lock:
+            candidates = {key: entry for key, entry in self.partitions.items()
+                          if key != self.UNDATED and key < cutoff_key and not entry["archived"]
+                          and entry["last"] < cutoff and key not in self.dirty_partitions}
+            generation, next_id = self.generation, self.next_id
+            self._journal_lock.acquire()
+        try:
+            if not candidates:
+                return []
+            archived = {}
+            for key, entry in candidates.items():
+                name = entry["file"] + ".gz"
+                temp_filename = self.segment_path(name) + ".tmp"
+                with open(self.segment_path(entry["file"]), 'rb') as source:
+                    data = gzip.compress(source.read())
+                with open(temp_filename, 'wb') as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_filename, self.segment_path(name))
+                archived[key] = dict(entry, file=name, archived=True)
+            fsync_directory(self.directory)
+            partitions = dict(self.partitions, **archived)
+            self.write_manifest(partitions, generation, next_id)
+            self.partitions = partitions
+            for entry in candidates.values():
+                os.remove(self.segment_path(entry["file"]))
+            logger.info("Archived %s partition(s) in '%s'.", len(archived), self.directory)
+            return sorted(archived)
+        finally:
+            self._journal_lock.release()
+
+    def gauges(self):
+        gauges = super().gauges()
+        gauges.update({
+            "stored_events": sum(entry["events"] for entry in self.partitions.values()),
+            "partitions": len(self.partitions),
+            "loaded_partitions": len(self.loaded_partitions & set(self.partitions)),
+            "archived_partitions": sum(entry["archived"] for entry in self.partitions.values()),
+            "dirty_partitions": len(self.dirty_partitions),
+        })
+        return gauges
+
+    # Queries first load the partitions they need, outside the read lock
+    def get_event(self, event_id):
+        """Get an event by ID, loading the remaining partitions if it is not among the loaded ones"""
+        event = super().get_event(event_id)
+        if event is None and not self.loaded_partitions.issuperset(self.partitions):
+            self.load_all_partitions()
+            event = super().get_event(event_id)
+        return event
+
+    def get_all_events(self):
+        self.load_all_partitions()
+        return super().get_all_events()
+
+    def undated_events(self):
+        self.load_partitions([self.UNDATED])
+        return super().undated_events()
+
+    def get_events_between(self, start, end=None):
+        self.load_partitions(self.partitions_overlapping(*self.query_range(start, end)))
+        return super().get_events_between(start, end)
+
+    def events_overlapping(self, start_minutes, end_minutes):
+        self.load_partitions(self.partitions_overlapping(start_minutes, end_minutes))
+        return super().events_overlapping(start_minutes, end_minutes)
+
+    def get_events_by_keyword(self, keyword, match="substring"):
+        if keyword:
+            self.load_all_partitions()
+        return super().get_events_by_keyword(keyword, match)
+
+    def search(self, query, limit=50):
+        if query and query.strip():
+            self.load_all_partitions()
+        return super().search(query, limit)
+
+# The shared Calendar instance is created on first use rather than on import,
+# so importing Main never reads the events file
+default_calendar = None
+default_calendar_lock = threading.Lock()
+
+# Options that only say how changes are written, moot for a read-only calendar
+SAVE_OPTIONS = {"journaled", "compact_threshold", "background_save", "save_delay", "max_save_delay",
+                "backup_count", "shared", "snapshot_format"}
+
+def get_calendar(**options):
+    """Return the shared Calendar, creating it with the given options on first use
+
+    Later calls may repeat options but not contradict them: asking for, say,
+    shared=True after an unshared calendar was created raises ValueError
+    instead of silently returning a calendar that behaves differently.
+    autoload is only used on creation.
+    """
+    global default_calendar
+    with default_calendar_lock:
+        if default_calendar is None:
+            default_calendar = Calendar(**options)
+            return default_calendar
+        calendar = default_calendar
+    conflicts = []
+    for name, value in options.items():
+        if name == "autoload" or (calendar.read_only and name in SAVE_OPTIONS):
+            continue
+        current = calendar.metrics is not None if name == "instrumented" else getattr(calendar, name, value)
+        if current != value:
+            conflicts.append(f"{name}={current!r} (asked for {value!r})")
+    if conflicts:
+        raise ValueError("The shared calendar already exists with " + ", ".join(conflicts))
+    return calendar
+
+def __getattr__(name):
+    # Keep `Main.calendar` working as a lazily created singleton
+    if name == "calendar":
+        return get_calendar()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
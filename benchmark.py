@@ -0,0 +1,543 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import Main
+
+SIZES = [1_000, 10_000, 100_000]  # Pass --sizes ... 1000000 for the large run
+
+def make_calendar(size, filename):
+    """Create an in-memory Calendar holding `size` synthetic events"""
+    calendar = Main.Calendar(filename, autoload=False)
+    # Measure the in-memory data structures, not disk writes
+    calendar.record_change = lambda *args, **kwargs: None
+    base = datetime(2026, 1, 1)
+    events = []
+    for i in range(size):
+        start = base + timedelta(minutes=random.randrange(0, 60 * 24 * 365 * 3))
+        event = Main.Event(f"Event {i}", start.strftime(Main.DATE_FORMAT),
+                           (start + timedelta(hours=1)).strftime(Main.DATE_FORMAT))
+        event.id = i + 1
+        events.append(event)
+    events.sort(key=Main.start_order)
+    calendar.events = events
+    calendar.next_id = size + 1
+    calendar.rebuild_indexes()
+    return calendar
+
+LOCATIONS = ["Office", "Room 101", "Room 204", "Berlin", "Prague", "Online", "Cafeteria"]
+KEYWORDS = ["work", "meeting", "team", "hr", "review", "1:1", "travel", "family", "gym", "birthday"]
+# Real calendars are skewed: a few locations and keywords cover most events
+# (Zipf-like weights), and many events have no location at all
+LOCATION_CHOICES = [""] + LOCATIONS
+LOCATION_WEIGHTS = [40] + [30 / rank for rank in range(1, len(LOCATIONS) + 1)]
+KEYWORD_WEIGHTS = [1 / rank for rank in range(1, len(KEYWORDS) + 1)]
+TITLES = ["Team sync", "1:1 with manager", "Design review", "Dentist", "Lunch", "Flight to Berlin",
+          "Conference", "Gym", "Birthday party", "Sprint planning", "Holiday", "Call with client"]
+DESCRIPTIONS = ["", "", "", "Weekly team sync", "Bring the roadmap draft", "Agenda in the shared doc",
+                "Remember the badge. " * 8]
+
+def make_rows(size, rng=random, base=datetime(2026, 1, 1)):
+    """Yield `size` synthetic event dicts in the Event.to_dict format, over three years from base
+
+    The mix: about 55% meetings in working hours (15 min to 2 h), 15% point
+    events without an end time, 10% all-day, 10% multi-day (1-6 days) and
+    10% evening events of 1-4 hours.
+    """
+    for i in range(size):
+        day = base + timedelta(days=rng.randrange(0, 365 * 3))
+        kind = rng.random()
+        if kind < 0.55:
+            start = day + timedelta(hours=rng.randrange(8, 18), minutes=rng.choice((0, 15, 30, 45)))
+            end = start + timedelta(minutes=15 * rng.randint(1, 8))
+        elif kind < 0.70:
+            start, end = day + timedelta(minutes=rng.randrange(0, 1440)), None
+        elif kind < 0.80:
+            start, end = day, day + timedelta(minutes=1439)
+        elif kind < 0.90:
+            start = day + timedelta(hours=rng.randrange(6, 20))
+            end = start + timedelta(days=rng.randint(1, 6))
+        else:
+            start = day + timedelta(hours=rng.randrange(17, 22))
+            end = start + timedelta(hours=rng.randint(1, 4))
+        yield {
+            "id": i + 1,
+            "title": f"{rng.choice(TITLES)} {i}",
+            "start_time": start.strftime(Main.DATE_FORMAT),
+            "end_time": end.strftime(Main.DATE_FORMAT) if end else None,
+            "location": rng.choices(LOCATION_CHOICES, LOCATION_WEIGHTS)[0],
+            "description": rng.choice(DESCRIPTIONS),
+            "keywords": list(dict.fromkeys(rng.choices(KEYWORDS, KEYWORD_WEIGHTS, k=rng.choice((0, 1, 1, 2, 3))))),
+        }
+
+def bench_memory(size):
+    """Return MB allocated to hold `size` events as Event objects and as EventColumns"""
+    # JSON decoding produces a fresh string per field; copy them to mimic that
+    rows = [{key: (value[:] if isinstance(value, list) else value) for key, value in row.items()}
+            for row in make_rows(size)]
+    results = []
+    for columnar in (False, True):
+        tracemalloc.start()
+        if columnar:
+            store = Main.EventColumns()
+            events = [store.append(Main.Event.from_dict(row)) for row in rows]
+        else:
+            events = [Main.Event.from_dict(row) for row in rows]
+        results.append(tracemalloc.get_traced_memory()[0] / 1e6)
+        tracemalloc.stop()
+        del events
+    return results
+
+def bench_import(size, workdir):
+    """Return seconds for `import Main` and for the first Main.calendar access with a `size`-event file"""
+    filename = os.path.join(workdir, "calendar_events.json")
+    calendar = Main.Calendar(filename, autoload=False)
+    calendar.add_events_bulk(make_rows(size))
+    code = ("import time; start = time.perf_counter(); import Main; imported = time.perf_counter(); "
+            "Main.calendar; print(imported - start, time.perf_counter() - imported)")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    os.remove(filename)
+    return tuple(float(value) for value in output.split())
+
+def bench_id_operations(size, filename, samples=1000):
+    """Return average microseconds per get_event and per delete_event"""
+    calendar = make_calendar(size, filename)
+    ids = random.sample(range(1, size + 1), min(samples, size))
+
+    start = time.perf_counter()
+    for event_id in ids:
+        calendar.get_event(event_id)
+    lookup_us = (time.perf_counter() - start) / len(ids) * 1e6
+
+    start = time.perf_counter()
+    for event_id in ids:
+        calendar.delete_event(event_id)
+    delete_us = (time.perf_counter() - start) / len(ids) * 1e6
+    return lookup_us, delete_us
+
+def bench_snapshot_formats(size, workdir, repeat=3):
+    """Return {format: (file MB, best save s, best load s)} for a `size`-event calendar in each snapshot format"""
+    source = os.path.join(workdir, "formats_source.json")
+    Main.Calendar(source, autoload=False).add_events_bulk(make_rows(size))
+    results = {}
+    for snapshot_format in Main.SNAPSHOT_FORMATS:
+        filename = os.path.join(workdir, f"formats.{snapshot_format}")
+        calendar = Main.Calendar(source, snapshot_format=snapshot_format, backup_count=0)
+        calendar.filename = filename  # Save the loaded events to the new file
+        save_s = timed(calendar.save_events, repeat)[1]
+        load_s = timed(lambda: Main.Calendar(filename, backup_count=0), repeat)[1]
+        results[snapshot_format] = (os.path.getsize(filename) / 1e6, save_s, load_s)
+        os.remove(filename)
+    os.remove(source)
+    return results
+
+def bench_mapped(size, workdir):
+    """Return (open s, week query s) for a `size`-event binary snapshot, loaded normally and memory-mapped"""
+    filename = os.path.join(workdir, "mapped.bin")
+    Main.Calendar(filename, autoload=False, snapshot_format="binary", backup_count=0).add_events_bulk(make_rows(size))
+    results = []
+    for open_calendar in (lambda: Main.Calendar(filename, backup_count=0), lambda: Main.MappedCalendar(filename)):
+        start = time.perf_counter()
+        calendar = open_calendar()
+        opened = time.perf_counter()
+        calendar.get_events_between("2027-06-01 00:00", "2027-06-07 23:59")
+        results.append((opened - start, time.perf_counter() - opened))
+        calendar.close()
+    os.remove(filename)
+    return results
+
+def bench_partitioned(size, workdir):
+    """Return (open + upcoming query s, one edit and its save s) for a `size`-event calendar, single-file and partitioned by month"""
+    filename = os.path.join(workdir, "partitioned.json")
+    directory = os.path.join(workdir, "partitioned")
+    Main.Calendar(filename, autoload=False, backup_count=0).add_events_bulk(make_rows(size))
+    Main.PartitionedCalendar(directory, json_filename=filename).close()  # Migrates the file
+    results = []
+    for open_calendar in (lambda: Main.Calendar(filename, backup_count=0),
+                          lambda: Main.PartitionedCalendar(directory, json_filename=filename)):
+        start = time.perf_counter()
+        calendar = open_calendar()
+        # "Upcoming" as of the last quarter of the three years of data
+        upcoming = calendar.get_events_between("2028-10-01 00:00", None)
+        opened = time.perf_counter()
+        event = upcoming[0]
+        calendar.edit_event(event.id, "Edited", event.start_time, event.end_time)
+        results.append((opened - start, time.perf_counter() - opened))
+        calendar.close()
+    os.remove(filename)
+    shutil.rmtree(directory)
+    return results
+
+def bench_instrumentation(size, filename, samples=10_000):
+    """Return average microseconds per get_event and per add_event without and with instrumented=True"""
+    results = []
+    for instrumented in (False, True):
+        calendar = make_calendar(size, filename)
+        calendar.metrics = Main.Metrics() if instrumented else None
+        ids = [random.randrange(1, size + 1) for _ in range(samples)]
+        lookup = per_call(calendar.get_event, [(event_id,) for event_id in ids])["avg_us"]
+        add = per_call(calendar.add_event, [("Bench", "2026-06-01 10:00", "2026-06-01 11:00")] * (samples // 10))
+        results.append((lookup, add["avg_us"]))
+    return results
+
+def timed(func, repeat=3):
+    """Run func() `repeat` times; return (first, best) wall-clock seconds
+
+    The first run includes lazy work such as index builds; the best run is
+    the steady state.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings[0], min(timings)
+
+def traced(func):
+    """Run func() under tracemalloc; return (result, peak MB during the call, MB still held by the result)"""
+    tracemalloc.start()
+    try:
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+        return result, peak / 1e6, current / 1e6
+    finally:
+        tracemalloc.stop()
+
+def measure(func, repeat=3, memory=True):
+    """Time func() and, unless memory=False, trace its peak allocation in one extra run"""
+    first, best = timed(func, repeat)
+    result = {"first_s": first, "best_s": best}
+    if memory:
+        result["peak_mb"] = traced(func)[1]
+    return result
+
+def per_call(func, args_list):
+    """Call func(*args) for every entry of args_list; return average microseconds per call"""
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return {"avg_us": (time.perf_counter() - start) / len(args_list) * 1e6, "calls": len(args_list)}
+
+def bench_gui_refresh(calendar, repeat=3):
+    """Time CalendarApp.refresh_events over `calendar` in both views
+
+    Needs ttkbootstrap and a display; otherwise the reason is returned as
+    {"skipped": ...}.
+    """
+    try:
+        import GUI
+        # CalendarApp picks up the shared calendar, so hand it ours
+        Main.default_calendar = calendar
+        app = GUI.CalendarApp()
+    except Exception as e:  # ImportError without ttkbootstrap, TclError without a display
+        Main.default_calendar = None
+        return {"skipped": f"{type(e).__name__}: {e}"}
+    try:
+        app.withdraw()
+        results = {}
+        for view in ("upcoming", "all"):
+            app.view_var.set(view)
+            results[view] = measure(lambda: (app.refresh_events(), app.update_idletasks()), repeat)
+        return results
+    finally:
+        calendar.unsubscribe(app.on_calendar_change)
+        app.destroy()
+        Main.default_calendar = None
+
+def bench_suite(size, workdir, rng, samples=200, repeat=3, gui=True):
+    """Measure the Calendar hot paths on a `size`-event synthetic calendar; return a dict of results
+
+    load/save/query/refresh report first and best-of-`repeat` seconds and
+    peak traced MB; add/edit/delete report the average over `samples` calls
+    on a journaled calendar, so each includes appending its journal record.
+    """
+    filename = os.path.join(workdir, "suite_events.json")
+    # Around today, so get_upcoming_events sees a realistic share of the calendar
+    base = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=365 * 3 // 2)
+    writer = Main.Calendar(filename, autoload=False)
+    writer.add_events_bulk(make_rows(size, rng, base))  # Saves the snapshot once
+    results = {"file_mb": os.path.getsize(filename) / 1e6}
+
+    results["load_events"] = measure(lambda: Main.Calendar(filename), repeat)
+    results["retained_mb"] = traced(lambda: Main.Calendar(filename))[2]
+
+    calendar = Main.Calendar(filename, journaled=True, compact_threshold=10 ** 9)
+    results["save_events"] = measure(calendar.save_events, repeat)
+
+    rows = list(make_rows(samples, rng, base))
+    results["add_event"] = per_call(calendar.add_event, [
+        (row["title"], row["start_time"], row["end_time"], row["location"], row["description"], row["keywords"])
+        for row in rows])
+    ids = rng.sample([event.id for event in calendar.events], min(samples, size))
+    edits = []
+    for event_id in ids:
+        event = calendar.get_event(event_id)
+        edits.append((event.id, event.title + " (moved)", event.start_time, event.end_time, event.location,
+                      event.description, event.keywords))
+    results["edit_event"] = per_call(calendar.edit_event, edits)
+    results["delete_event"] = per_call(calendar.delete_event, [(event_id,) for event_id in ids])
+
+    results["get_upcoming_events"] = measure(calendar.get_upcoming_events, repeat)
+    results["get_upcoming_events"]["events"] = len(calendar.get_upcoming_events())
+    for match in ("substring", "prefix", "exact"):
+        # The most common keyword, so the result (not the lookup) dominates
+        results[f"get_events_by_keyword[{match}]"] = measure(
+            lambda: calendar.get_events_by_keyword(KEYWORDS[0], match), repeat)
+
+    if gui:
+        results["refresh_events"] = bench_gui_refresh(calendar, repeat)
+    calendar.close()
+    for path in (filename, calendar.journal_filename, *calendar.backup_filenames()):
+        if os.path.exists(path):
+            os.remove(path)
+    return results
+
+def compare_runs(baseline, current, threshold=1.2):
+    """Print the timings of two bench_suite JSON runs side by side, flagging slowdowns beyond threshold"""
+    print(f"{'events':>10} {'operation':<34} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for size, operations in current["results"].items():
+        for name, now in operations.items():
+            then = baseline["results"].get(size, {}).get(name)
+            if not isinstance(now, dict) or not isinstance(then, dict):
+                continue
+            for key in ("best_s", "avg_us"):
+                if key in now and key in then:
+                    ratio = now[key] / then[key] if then[key] else float("inf")
+                    flag = "  slower" if ratio > threshold else ""
+                    print(f"{size:>10} {name:<34} {then[key]:>12.6g} {now[key]:>12.6g} {ratio:>7.2f}{flag}")
+
+def print_suite(size, results):
+    """Print one bench_suite result as table rows"""
+    for name, result in results.items():
+        if not isinstance(result, dict):
+            print(f"{size:>10} {name:<34} {result:>12.2f}")
+        elif "avg_us" in result:
+            print(f"{size:>10} {name:<34} {result['avg_us']:>10.1f}us")
+        elif "best_s" in result:
+            print(f"{size:>10} {name:<34} {result['best_s']:>11.4f}s {result['first_s']:>11.4f}s"
+                  f" {result['peak_mb']:>9.1f}MB")
+        elif "skipped" in result:
+            print(f"{size:>10} {name:<34} skipped ({result['skipped']})")
+        else:
+            print_suite(size, {f"{name}[{key}]": value for key, value in result.items()})
+
+def check_undated_upcoming(workdir):
+    """Check that every backend lists events whose start time does not parse after the upcoming ones
+
+    Raises AssertionError if one drops them or puts them first.
+    """
+    filename = os.path.join(workdir, "undated.json")
+    soon = (datetime.now() + timedelta(days=30)).strftime(Main.DATE_FORMAT)
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"events": [{"id": 1, "title": "Someday", "start_time": "someday"},
+                              {"id": 2, "title": "Soon", "start_time": soon}], "next_id": 3}, f)
+    binary = os.path.join(workdir, "undated.bin")
+    main_logger = logging.getLogger(Main.__name__)
+    level = main_logger.level
+    main_logger.setLevel(logging.ERROR)  # The bad start time is warned about on every load
+    try:
+        Main.convert_snapshot(filename, binary)
+        for open_calendar in (lambda: Main.Calendar(filename, backup_count=0),
+                              lambda: Main.SqliteCalendar(os.path.join(workdir, "undated.db"), json_filename=filename),
+                              lambda: Main.PartitionedCalendar(os.path.join(workdir, "undated"), json_filename=filename),
+                              lambda: Main.MappedCalendar(binary)):
+            calendar = open_calendar()
+            titles = [event.title for event in calendar.get_upcoming_events()]
+            calendar.close()
+            assert titles == ["Soon", "Someday"], f"{type(calendar).__name__} upcoming events: {titles}"
+    finally:
+        main_logger.setLevel(level)
+
+def stress_thread_safety(filename, threads=16, operations=500):
+    """Hammer a thread-safe Calendar from many threads, check its invariants, return (ops, seconds)
+
+    Half of the threads add, edit and delete events (alone and in bulk), the
+    other half run time-range, keyword and text queries and check every
+    result they get back. Raises AssertionError on any inconsistency.
+    """
+    calendar = Main.Calendar(filename, autoload=False, thread_safe=True, background_save=True, save_delay=0.05)
+    calendar.loaded = True
+    added = []    # Per-writer lists of ids the writer added
+    deleted = []  # Per-writer lists of ids the writer deleted
+    failures = []
+    start_barrier = threading.Barrier(threads)
+
+    def writer(rng, mine, gone):
+        start_barrier.wait()
+        for _ in range(operations):
+            roll = rng.random()
+            if roll < 0.5 or not mine:
+                start = datetime(2026, 1, 1) + timedelta(minutes=rng.randrange(0, 60 * 24 * 365))
+                event = calendar.add_event(f"Stress {rng.random():.6f}", start.strftime(Main.DATE_FORMAT),
+                                           (start + timedelta(hours=1)).strftime(Main.DATE_FORMAT),
+                                           rng.choice(LOCATIONS), "", rng.sample(KEYWORDS, 2))
+                mine.append(event.id)
+            elif roll < 0.7:
+                event = calendar.get_event(rng.choice(mine))
+                calendar.edit_event(event.id, event.title + "!", event.start_time, event.end_time,
+                                    event.location, event.description, event.keywords,
+                                    expected_version=event.version)
+            elif roll < 0.9:
+                event_id = mine.pop(rng.randrange(len(mine)))
+                assert calendar.delete_event(event_id)
+                gone.append(event_id)
+            else:
+                events, errors = calendar.add_events_bulk(make_rows(5))
+                assert not errors
+                mine.extend(event.id for event in events)
+
+    def reader(rng):
+        start_barrier.wait()
+        for _ in range(operations):
+            roll = rng.random()
+            if roll < 0.4:
+                low = 29_000_000 + rng.randrange(0, 500_000)
+                events = calendar.events_overlapping(low, low + 10_000)
+                starts = [event.start_minutes for event in events]
+                assert starts == sorted(starts), "range result out of order"
+                assert all(event.start_minutes <= low + 10_000
+                           and (event.end_minutes if event.end_minutes is not None else event.start_minutes) >= low
+                           for event in events)
+            elif roll < 0.7:
+                keyword = rng.choice(KEYWORDS)
+                assert all(keyword in event.keywords for event in calendar.get_events_by_keyword(keyword, "exact"))
+            elif roll < 0.9:
+                calendar.search("stress")
+            else:
+                events = calendar.get_all_events()
+                assert len({event.id for event in events}) == len(events), "duplicate events listed"
+
+    def run(target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            failures.append(e)
+
+    workers = []
+    for n in range(threads):
+        rng = random.Random(n)
+        if n % 2:
+            workers.append(threading.Thread(target=run, args=(reader, rng)))
+        else:
+            added.append([])
+            deleted.append([])
+            workers.append(threading.Thread(target=run, args=(writer, rng, added[-1], deleted[-1])))
+    begin = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+    calendar.close()
+    assert not failures, f"{len(failures)} thread(s) failed, first: {failures[0]!r}"
+
+    live_ids = sorted(event_id for ids in added for event_id in ids)
+    all_ids = live_ids + [event_id for ids in deleted for event_id in ids]
+    assert len(set(all_ids)) == len(all_ids), "an id was handed out twice"
+    assert sorted(event.id for event in calendar.events) == live_ids, "events were lost or resurrected"
+    assert len(calendar.events_by_id) == len(calendar.time_index) == len(live_ids), "indexes out of step"
+    reloaded = Main.Calendar(filename)
+    assert [event.to_dict() for event in reloaded.events] == [event.to_dict() for event in calendar.events], \
+        "saved file differs from memory"
+    os.remove(filename)
+    return threads * operations, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Calendar hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="calendar sizes to run the benchmarks at")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing; the best is reported")
+    parser.add_argument("--samples", type=int, default=200, help="calls per add/edit/delete measurement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", metavar="FILE", help="write the suite results to FILE")
+    parser.add_argument("--compare", metavar="FILE", help="compare with the results of an earlier --json run")
+    parser.add_argument("--no-gui", action="store_true", help="skip the GUI refresh_events measurement")
+    parser.add_argument("--suite-only", action="store_true", help="skip the older micro-benchmarks and stress test")
+    options = parser.parse_args()
+
+    random.seed(options.seed)
+    # Keep per-call logging out of the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    run = {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+                 "platform": platform.platform(), "seed": options.seed, "repeat": options.repeat,
+                 "samples": options.samples},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'events':>10} {'operation':<34} {'best':>12} {'first':>12} {'peak':>11}")
+        for size in options.sizes:
+            # Same synthetic calendar for a given seed and size, whatever ran before
+            rng = random.Random(f"{options.seed}-{size}")
+            results = bench_suite(size, workdir, rng, options.samples, options.repeat, gui=not options.no_gui)
+            run["results"][str(size)] = results
+            print_suite(size, results)
+
+        if options.json:
+            with open(options.json, "w", encoding="utf-8") as f:
+                json.dump(run, f, indent=2)
+            print(f"\nResults written to {options.json}")
+        if options.compare:
+            with open(options.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+            print()
+            compare_runs(baseline, run)
+        if options.suite_only:
+            return
+
+        filename = os.path.join(workdir, "bench_events.json")
+        print(f"\n{'events':>10} {'get_event us':>14} {'delete_event us':>16}")
+        for size in options.sizes:
+            lookup_us, delete_us = bench_id_operations(size, filename)
+            print(f"{size:>10} {lookup_us:>14.2f} {delete_us:>16.2f}")
+
+        print(f"\n{'events':>10} {'objects MB':>12} {'columnar MB':>12}")
+        for size in options.sizes:
+            objects_mb, columnar_mb = bench_memory(size)
+            print(f"{size:>10} {objects_mb:>12.1f} {columnar_mb:>12.1f}")
+
+        print(f"\n{'events':>10} {'import s':>10} {'first access s':>15}")
+        for size in options.sizes:
+            import_s, access_s = bench_import(size, workdir)
+            print(f"{size:>10} {import_s:>10.3f} {access_s:>15.3f}")
+
+        print(f"\n{'events':>10} {'format':>8} {'file MB':>9} {'save s':>8} {'load s':>8}")
+        for size in options.sizes:
+            for snapshot_format, (mb, save_s, load_s) in bench_snapshot_formats(size, workdir).items():
+                print(f"{size:>10} {snapshot_format:>8} {mb:>9.1f} {save_s:>8.3f} {load_s:>8.3f}")
+
+        print(f"\n{'events':>10} {'mode':>8} {'open s':>9} {'week query s':>13}")
+        for size in options.sizes:
+            for mode, (open_s, query_s) in zip(("loaded", "mapped"), bench_mapped(size, workdir)):
+                print(f"{size:>10} {mode:>8} {open_s:>9.4f} {query_s:>13.4f}")
+
+        print(f"\n{'events':>10} {'layout':>12} {'open + upcoming s':>18} {'edit + save s':>14}")
+        for size in options.sizes:
+            for layout, (open_s, edit_s) in zip(("single file", "partitioned"), bench_partitioned(size, workdir)):
+                print(f"{size:>10} {layout:>12} {open_s:>18.3f} {edit_s:>14.3f}")
+
+        (lookup_off, add_off), (lookup_on, add_on) = bench_instrumentation(max(options.sizes), filename)
+        print(f"\n{'instrumented':>12} {'get_event us':>14} {'add_event us':>14}")
+        print(f"{'no':>12} {lookup_off:>14.2f} {add_off:>14.2f}")
+        print(f"{'yes':>12} {lookup_on:>14.2f} {add_on:>14.2f}")
+
+        check_undated_upcoming(workdir)
+        print("\nUpcoming events keep unparsable start times on every backend")
+
+        operations, elapsed = stress_thread_safety(filename)
+        print(f"\nThread stress: {operations} operations from 16 threads in {elapsed:.2f}s, invariants hold")
+
+if __name__ == "__main__":
+    main()